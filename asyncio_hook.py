@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import functools
+
+import exc_i18n
+from exc_i18n import TranslationMissing, TranslationNotSupported
+
+
+def _call(func, *args):
+    return func(*args)
+
+
+class I18nExceptionHandler(object):
+    """asyncio event loop exception handler that adds the translation of the
+    exception message to the context message, then passes the context to
+    the previous handler (or the loop default one).
+
+    The loop never blocks on a translation: unless the result is already in
+    the cache of the translator, the lookup (and the load of the databases
+    or of a language, or the request to a translation daemon) runs in the
+    loop default executor, in the context of the failed task, so in the
+    language it chose. Contexts without an exception, with an
+    untranslatable one or that arrive when the loop can't run the lookup
+    anymore (it is closed) go to the previous handler untouched.
+    """
+
+    def __init__(self, previous=None):
+        self.previous = previous
+
+    def __call__(self, loop, context):
+        exception = context.get('exception')
+        if exception is None or not exception.args \
+          or not isinstance(exception.args[0], str):
+            self.fallback(loop, context)
+            return
+        exc_name = type(exception).__name__
+        task = context.get('task')
+        if hasattr(task, 'get_context'):
+            # a copy: a Context can't be entered by two threads at once
+            run = task.get_context().copy().run
+        else:
+            run = _call
+        result = run(self._cached, exc_name, exception.args[0])
+        if result is not None:
+            self.handle(loop, context, *result)
+            return
+        # eg. a task that failed is collected after asyncio.run() returned
+        if loop.is_closed():
+            self.fallback(loop, context)
+            return
+        try:
+            future = loop.run_in_executor(None, run, self._lookup,
+                                          exc_name, exception.args[0])
+        except RuntimeError:
+            # the loop or its executor were shut down
+            self.fallback(loop, context)
+            return
+        future.add_done_callback(
+            functools.partial(self._translated, loop, context))
+
+    @staticmethod
+    def _cached(exc_name, formatted_msg):
+        "returns the cached (translation, error) of the message, or None"
+        translator = exc_i18n.translator
+        cache = getattr(translator, 'cache', None)
+        if cache is None:
+            return None
+        return cache.get((translator.language_code, exc_name, formatted_msg))
+
+    @staticmethod
+    def _lookup(exc_name, formatted_msg):
+        "returns (translation, None) or (None, error), loading the translator"
+        try:
+            return exc_i18n.get_translator().translate(exc_name,
+                                                       formatted_msg), None
+        except (TranslationMissing, TranslationNotSupported) as e:
+            return None, type(e)
+
+    def _translated(self, loop, context, future):
+        if future.cancelled() or future.exception() is not None:
+            self.fallback(loop, context)
+        else:
+            self.handle(loop, context, *future.result())
+
+    def handle(self, loop, context, translation, error):
+        if error:
+            self.fallback(loop, context)
+            return
+        context = dict(context)
+        context['message'] = '%s\n%s: %s' % (context.get('message'),
+                                             type(context['exception']).__name__,
+                                             translation)
+        self.fallback(loop, context)
+
+    def fallback(self, loop, context):
+        if self.previous is not None:
+            self.previous(loop, context)
+        else:
+            loop.default_exception_handler(context)
+
+
+def install(loop=None):
+    """installs an I18nExceptionHandler on loop (by default the running
+    loop) and returns it"""
+    if loop is None:
+        loop = asyncio.get_running_loop()
+    handler = I18nExceptionHandler(loop.get_exception_handler())
+    loop.set_exception_handler(handler)
+    return handler
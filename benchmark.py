@@ -0,0 +1,666 @@
+import gc
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+from database import ExceptionDatabase, ExceptionObj, TranslationDatabase, \
+                     TranslationObj
+import compact_db
+import exc_i18n
+from exc_i18n import ExceptionTranslator, parse_template, split_template
+
+description = 'Measures the latency of the exception translation hot path'
+
+# values used to format the templates in the sample messages
+SAMPLE_VALUES = {'d': '42', 'i': '42', 'u': '42', 'x': 'ff', 'X': 'FF',
+                 'p': '0x7f00', 'c': 'x'}
+
+
+def load_exc_db(path='./exc_db.pickle'):
+    with open(path, 'rb') as f:
+        return ExceptionDatabase.load_from_pickle(f)
+
+
+def synthetic_translations(exc_db, language_code='es'):
+    """Returns a TranslationDatabase that "translates" every template to
+    itself, with every placeholder rewritten as a plain %s.
+    """
+    trans_db = TranslationDatabase()
+    for exc in exc_db.all():
+        translation = '%s'.join(part.replace('%', '%%')
+                                for part in split_template(exc.text))
+        trans_db.add(TranslationObj(exc.name, exc.text, language_code,
+                                    translation))
+    return trans_db
+
+
+def format_template(text, value=None):
+    "formats a template with sample values, or with value for every string"
+    literals, specs = parse_template(text)
+    msg = literals[0]
+    for spec, literal in zip(specs, literals[1:]):
+        conversion = spec.group('conversion')
+        if conversion in SAMPLE_VALUES:
+            msg += SAMPLE_VALUES[conversion]
+        else:
+            msg += 'x' if value is None else value
+        msg += literal
+    return msg
+
+
+def sample_messages(exc_db, count=200):
+    """Returns (exc_name, formatted_msg) pairs built from the templates of
+    exc_db, replacing every placeholder by a sample value.
+    """
+    # the importer leaves a few templates with an empty text
+    templates = sorted(exc for exc in exc_db.all() if exc.text)[:count]
+    return [(exc.name, format_template(exc.text)) for exc in templates]
+
+
+def bench_cold_warm(exc_db, trans_db, samples, repeat=5):
+    """Cold: build a translator and translate every sample once.
+    Warm: translate every sample again with the same translator.
+    Returns the best per-message latency of each, in microseconds.
+    """
+    def translate_all(translator):
+        for exc_name, msg in samples:
+            translator.translate(exc_name, msg)
+
+    cold = []
+    warm = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        translator = ExceptionTranslator(exc_db, trans_db)
+        translate_all(translator)
+        cold.append(time.perf_counter() - start)
+        warm.append(min(timeit.repeat(lambda: translate_all(translator),
+                                      number=1, repeat=3)))
+
+    per_msg = lambda seconds: min(seconds) / len(samples) * 1e6
+    return {'cold_us': per_msg(cold), 'warm_us': per_msg(warm)}
+
+
+def percentiles(timings):
+    "returns the p50, p90, p99 and max of timings (seconds), in microseconds"
+    timings = sorted(timings)
+    at = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1e6
+    return {'p50_us': at(0.5), 'p90_us': at(0.9), 'p99_us': at(0.99),
+            'max_us': timings[-1] * 1e6}
+
+
+def time_calls(func, args, rounds):
+    "calls func(*a) for every a in args, rounds times, timing every call"
+    timings = []
+    clock = time.perf_counter
+    for i in range(rounds):
+        for a in args:
+            start = clock()
+            try:
+                func(*a)
+            except (exc_i18n.TranslationMissing,
+                    exc_i18n.TranslationNotSupported):
+                pass
+            timings.append(clock() - start)
+    return timings
+
+
+def bench_translate_latency(exc_db, trans_db, count=200, rounds=20):
+    """Times every translate() call, without the results cache, on
+    messages of templates without format specifiers (exact) and with them
+    (formatted), in a language that translates them (hit) and one that
+    doesn't (miss), and on messages that match no template (unsupported).
+    Returns the percentiles of every kind, in microseconds.
+    """
+    templates = sorted(exc for exc in exc_db.all() if exc.text)
+    exact = [(exc.name, exc.text) for exc in templates
+             if len(split_template(exc.text)) == 1][:count]
+    formatted = [(exc.name, format_template(exc.text)) for exc in templates
+                 if len(split_template(exc.text)) > 1][:count]
+    unsupported = [(exc_name, msg + ' (unknown)')
+                   for exc_name, msg in formatted]
+
+    translator = ExceptionTranslator(exc_db, trans_db)
+    translator.set_language_code('es')
+    result = {}
+    for kind, messages in (('exact', exact), ('formatted', formatted)):
+        result[kind + '_hit'] = percentiles(
+            time_calls(translator.translate, messages, rounds))
+        with exc_i18n.use_language('xx'):
+            result[kind + '_miss'] = percentiles(
+                time_calls(translator.translate, messages, rounds))
+    result['unsupported'] = percentiles(
+        time_calls(translator.translate, unsupported, rounds))
+    return result
+
+
+def bench_database(exc_db, trans_db, samples, rounds=20):
+    """Times ExceptionDatabase.filter() by name and by prefix, and
+    TranslationDatabase.get() and get_many().
+    Returns the mean time of a call, in microseconds.
+    """
+    names = [(exc_name,) for exc_name, msg in samples]
+    prefixes = [(exc_name[:3],) for exc_name, msg in samples]
+    keys = sorted((exc.name, exc.text) for exc in exc_db.all())[:len(samples)]
+
+    def mean_us(func, args):
+        return sum(time_calls(func, args, rounds)) / (len(args) * rounds) * 1e6
+
+    return {
+        'filter_name_us': mean_us(lambda name: exc_db.filter(name=name), names),
+        'filter_prefix_us': mean_us(lambda prefix: exc_db.filter(prefix=prefix),
+                                    prefixes),
+        'get_us': mean_us(lambda name, text: trans_db.get(name, text, 'es'),
+                          keys),
+        'get_many_us_per_key': mean_us(lambda: trans_db.get_many(keys, 'es'),
+                                       [()]) / len(keys),
+    }
+
+
+def scaled_database(exc_db, factor):
+    """Returns a database with factor times the templates of exc_db: every
+    template plus factor - 1 variants of it with a distinct literal suffix.
+    """
+    scaled = ExceptionDatabase()
+    for exc in exc_db.all():
+        scaled.add(exc)
+        for i in range(1, factor):
+            scaled.add(ExceptionObj(exc.name, '%s [variant %d]' % (exc.text, i)))
+    return scaled
+
+
+def bench_scaling(exc_db, count=200, factors=(1, 10, 100), rounds=5):
+    """Runs the translator and database benchmarks on exc_db scaled by
+    every factor. Returns the results of every scale.
+    """
+    result = {}
+    for factor in factors:
+        db = scaled_database(exc_db, factor) if factor > 1 else exc_db
+        trans_db = synthetic_translations(db)
+        start = time.perf_counter()
+        ExceptionTranslator(db, trans_db)
+        build_ms = (time.perf_counter() - start) * 1e3
+        result['%dx' % factor] = {
+            'templates': len(db.all()),
+            'build_ms': build_ms,
+            'translate': bench_translate_latency(db, trans_db, count, rounds),
+            'database': bench_database(db, trans_db,
+                                       sample_messages(exc_db, count), rounds),
+        }
+    return result
+
+
+def bench_activate(repeat=3):
+    """Times exc_i18n.activate() in its eager, lazy and background modes, and
+    the load paid by the first uncaught exception after a lazy activate().
+    Returns the best time of each, in milliseconds.
+    """
+    def best_ms(func):
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1e3
+
+    def lazy_first_exception():
+        exc_i18n.activate(lazy=True)
+        exc_i18n.get_translator()
+
+    excepthook = sys.excepthook
+    try:
+        result = {
+            'eager_ms': best_ms(exc_i18n.activate),
+            'lazy_ms': best_ms(lambda: exc_i18n.activate(lazy=True)),
+            'background_ms': best_ms(lambda: exc_i18n.activate(background=True)),
+            'lazy_first_exception_ms': best_ms(lazy_first_exception),
+        }
+        exc_i18n.get_translator()
+    finally:
+        sys.excepthook = excepthook
+    return result
+
+
+def bench_load(exc_db_path='./exc_db.pickle', trans_db_path='./trans.pickle',
+               repeat=5):
+    """Times what activate() pays, loading both databases and building the
+    translator (with the plans of its language), from the pickles and from
+    the compact format (converted to temporary files). The regex cache is
+    purged before every run, so the regexes are compiled every time.
+    Returns the best time of each, in milliseconds.
+    """
+    def best_ms(func):
+        return min(timeit.repeat(func, setup=re.purge, number=1,
+                                 repeat=repeat)) * 1e3
+
+    def load_pickles():
+        exc_db, trans_db = exc_i18n.load_databases(exc_db_path, trans_db_path)
+        ExceptionTranslator(exc_db, trans_db)
+
+    tmpdir = tempfile.mkdtemp()
+    compact_exc = os.path.join(tmpdir, 'exc_db.bin')
+    compact_trans = os.path.join(tmpdir, 'trans.bin')
+    compact_db.convert(exc_db_path, compact_exc)
+    compact_db.convert(trans_db_path, compact_trans)
+    try:
+        def load_compact():
+            exc_db, trans_db = exc_i18n.load_databases(compact_exc, compact_trans)
+            ExceptionTranslator(exc_db, trans_db)
+            exc_db.close()
+            trans_db.close()
+
+        return {'pickle_ms': best_ms(load_pickles),
+                'compact_ms': best_ms(load_compact),
+                'pickle_bytes': (os.path.getsize(exc_db_path) +
+                                 os.path.getsize(trans_db_path)),
+                'compact_bytes': (os.path.getsize(compact_exc) +
+                                  os.path.getsize(compact_trans))}
+    finally:
+        os.remove(compact_exc)
+        os.remove(compact_trans)
+        os.rmdir(tmpdir)
+
+
+def bench_language_switch(exc_db, samples, switches=1000):
+    """Switches a translator back and forth between two languages,
+    translating one message after every switch, and times
+    exc_i18n.set_language_code() on the active translator.
+    Returns the mean time of each switch, in microseconds.
+    """
+    trans_db = synthetic_translations(exc_db, 'es')
+    for trans in synthetic_translations(exc_db, 'pt').all():
+        trans_db.add(trans)
+    translator = ExceptionTranslator(exc_db, trans_db)
+    translator.set_language_code('pt')
+    exc_name, msg = samples[0]
+
+    def switch_and_translate():
+        for i in range(switches // 2):
+            translator.set_language_code('es')
+            translator.translate(exc_name, msg)
+            translator.set_language_code('pt')
+            translator.translate(exc_name, msg)
+
+    def switch_module_language():
+        for i in range(switches // 2):
+            exc_i18n.set_language_code('es')
+            exc_i18n.set_language_code('en')
+
+    excepthook = sys.excepthook
+    try:
+        exc_i18n.activate()
+        module_elapsed = min(timeit.repeat(switch_module_language,
+                                           number=1, repeat=3))
+    finally:
+        sys.excepthook = excepthook
+    elapsed = min(timeit.repeat(switch_and_translate, number=1, repeat=3))
+    return {'switch_and_translate_us': elapsed / switches * 1e6,
+            'set_language_code_us': module_elapsed / switches * 1e6}
+
+
+# real CPython templates with many or adjacent placeholders, all ending in a
+# literal so appending a character to a message makes it a near miss
+PATHOLOGICAL_TEMPLATES = [
+    "%s%s takes at most %d argument%s (%d given)",
+    "%.200s() takes %zd positional arguments but %zd were given",
+    "%.100s() argument %d must be %.50s, not %.50s",
+    "%R: %R: %R: %R failed",
+    "%.50s: %.50s: %.50s: %.50s failed",
+    "can't find module %R%U%c__init__.py%U.py",
+]
+
+# three adjacent unbounded placeholders: a near miss takes minutes with the
+# untyped patterns, so it is only timed with the typed ones
+TYPED_ONLY_TEMPLATES = {"can't find module %R%U%c__init__.py%U.py"}
+
+
+def untyped_regex(text):
+    "the regex built before typed patterns: every placeholder as (.*?)"
+    literals = [re.escape(part) for part in split_template(text)]
+    return re.compile('^' + '(.*?)'.join(literals) + '$', re.DOTALL)
+
+
+def bench_pathological(size=1024):
+    """Matches the PATHOLOGICAL_TEMPLATES against messages with every string
+    value size characters long, and the same messages plus one character
+    (near misses). Returns the worst latency of the typed patterns and of the
+    untyped ones, in milliseconds.
+    """
+    translator = ExceptionTranslator(ExceptionDatabase(), TranslationDatabase())
+    result = {'typed_max_ms': 0.0, 'untyped_max_ms': 0.0}
+    for text in PATHOLOGICAL_TEMPLATES:
+        msg = format_template(text, 'v' * size)
+        typed = translator._build_deformating_regex(ExceptionObj('E', text))
+        regexes = [('typed_max_ms', typed)]
+        if text not in TYPED_ONLY_TEMPLATES:
+            regexes.append(('untyped_max_ms', untyped_regex(text)))
+        for key, regex in regexes:
+            for subject in (msg, msg + '!'):
+                elapsed = timeit.timeit(lambda: regex.match(subject), number=1)
+                result[key] = max(result[key], elapsed * 1e3)
+    return result
+
+
+def bench_daemon(exc_db, trans_db, samples, rounds=20, batch_size=50,
+                 pipeline=8):
+    """Starts a local translation daemon and measures its throughput, in
+    messages per second, with one message per request, with batches of
+    batch_size messages, and with up to pipeline batches in flight.
+    Like the daemon command, the translator has a results cache, here big
+    enough to hold every sample.
+    """
+    import threading
+    import translation_daemon
+
+    translator = ExceptionTranslator(
+        exc_db, trans_db,
+        cache_size=max(exc_i18n.DEFAULT_CACHE_SIZE, len(samples)))
+    translator.set_language_code('es')
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'bench.sock')
+    server = translation_daemon.TranslationServer(path, translator)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = translation_daemon.TranslationClient(path)
+    batches = [samples[i:i + batch_size]
+               for i in range(0, len(samples), batch_size)]
+
+    def single():
+        for exc_name, msg in samples:
+            client.translate_many([(exc_name, msg)])
+
+    def batched():
+        for batch in batches:
+            client.translate_many(batch)
+
+    def pipelined():
+        in_flight = 0
+        for batch in batches:
+            if in_flight == pipeline:
+                client.recv_batch()
+                in_flight -= 1
+            client.send_batch(batch)
+            in_flight += 1
+        for i in range(in_flight):
+            client.recv_batch()
+
+    try:
+        batched()  # warm the cache
+        result = {}
+        for name, func in (('single', single), ('batched', batched),
+                           ('pipelined', pipelined)):
+            elapsed = min(timeit.repeat(func, number=rounds, repeat=3))
+            result[name + '_msgs_per_s'] = len(samples) * rounds / elapsed
+        return result
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+        os.rmdir(tmpdir)
+
+
+def read_memory(pid):
+    "returns the Rss, Pss and Private_Dirty of a process, in kB"
+    memory = {}
+    with open('/proc/%d/smaps_rollup' % pid) as f:
+        for line in f:
+            if line.endswith(' kB\n'):
+                field, value = line.split(':')
+                memory[field] = int(value.split()[0])
+    return {'rss_kb': memory['Rss'], 'pss_kb': memory['Pss'],
+            'private_kb': memory['Private_Dirty']}
+
+
+def _prefork_master(setup, samples, workers, out):
+    """runs in a forked master: calls setup, forks the workers, which
+    translate the samples, then measures them while they are all alive"""
+    setup()
+    ready_r, ready_w = os.pipe()
+    go_r, go_w = os.pipe()
+    pids = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(go_w)
+            translator = exc_i18n.get_translator()
+            for exc_name, msg in samples:
+                try:
+                    translator.translate(exc_name, msg)
+                except (exc_i18n.TranslationMissing,
+                        exc_i18n.TranslationNotSupported):
+                    pass
+            # a long running worker sooner or later runs a full collection
+            gc.collect()
+            os.write(ready_w, b'.')
+            os.read(go_r, 1)
+            os._exit(0)
+        pids.append(pid)
+    os.close(go_r)
+    for i in range(workers):
+        os.read(ready_r, 1)
+    memory = [read_memory(pid) for pid in pids]
+    os.close(go_w)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    result = {field: sum(m[field] for m in memory) / workers
+              for field in memory[0]}
+    os.write(out, json.dumps(result).encode('ascii'))
+
+
+def bench_prefork(samples, workers=4, exc_db_path='./exc_db.pickle',
+                  trans_db_path='./trans.pickle'):
+    """Measures the memory of pre-forked workers, like the ones of
+    gunicorn, that translate the sample messages: loading the translator
+    in every worker, in the master with activate() (from the pickles), and
+    in the master with exc_i18n.preload() from the compact files, then
+    with freeze=True from the pickles and from the compact files.
+    Returns the mean Rss, Pss and Private_Dirty of a worker, in kB, of
+    every mode. Needs Linux /proc.
+    """
+    tmpdir = tempfile.mkdtemp()
+    compact_exc = os.path.join(tmpdir, 'exc_db.bin')
+    compact_trans = os.path.join(tmpdir, 'trans.bin')
+    compact_db.convert(exc_db_path, compact_exc)
+    compact_db.convert(trans_db_path, compact_trans)
+    modes = [('load_in_workers', lambda: None),
+             ('activate_pickles', exc_i18n.activate),
+             ('preload_compact', lambda: exc_i18n.preload(
+                 ['es'], compact_exc, compact_trans)),
+             ('frozen_pickles', lambda: exc_i18n.preload(
+                 ['es'], exc_db_path, trans_db_path, freeze=True)),
+             ('frozen_compact', lambda: exc_i18n.preload(
+                 ['es'], compact_exc, compact_trans, freeze=True))]
+    result = {}
+    try:
+        for name, setup in modes:
+            out_r, out_w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    exc_i18n.translator = None
+                    _prefork_master(setup, samples, workers, out_w)
+                finally:
+                    os._exit(0)
+            os.close(out_w)
+            with os.fdopen(out_r, 'rb') as f:
+                data = f.read()
+            os.waitpid(pid, 0)
+            result[name] = json.loads(data)
+        return result
+    finally:
+        os.remove(compact_exc)
+        os.remove(compact_trans)
+        os.rmdir(tmpdir)
+
+
+def synthetic_source_tree(path, copies=60):
+    """Fills path with a CPython-like source tree: copies of
+    test_data/posixmodule.c spread over Python/, Objects/ and Modules/.
+    """
+    with open('./test_data/posixmodule.c') as f:
+        text = f.read()
+    for i in range(copies):
+        directory = os.path.join(path, ('Python', 'Objects', 'Modules')[i % 3])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'module%03d.c' % i), 'w') as f:
+            f.write(text)
+    with open(os.path.join(path, 'Python', 'errors.c'), 'w') as f:
+        f.write(text)
+
+
+def bench_import_parallel(copies=60, jobs=None):
+    """Imports a synthetic source tree of copies files with one process and
+    with jobs processes (by default one per CPU).
+    Returns both times, in seconds, and the speedup.
+    """
+    from cpython_importer import CPythonExceptionImporter
+
+    jobs = jobs or max(2, os.cpu_count() or 1)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        synthetic_source_tree(tmpdir, copies)
+        importer = CPythonExceptionImporter(tmpdir)
+        start = time.perf_counter()
+        serial = importer.do_import()
+        serial_s = time.perf_counter() - start
+        start = time.perf_counter()
+        parallel = importer.do_import(jobs=jobs)
+        parallel_s = time.perf_counter() - start
+        assert parallel == serial
+    finally:
+        shutil.rmtree(tmpdir)
+    return {'files': copies, 'jobs': jobs, 'cpus': os.cpu_count(),
+            'serial_s': serial_s, 'parallel_s': parallel_s,
+            'speedup': serial_s / parallel_s}
+
+
+def regex_block_finder(text):
+    "the block finder the importer used before, three DOTALL regexes"
+    blocks = re.findall(r'(PyErr_SetString.*?);', text, re.DOTALL)
+    blocks.extend(re.findall(r'(PyErr_Format\(.*?PyExc.*?);', text, re.DOTALL))
+    blocks.extend(re.findall(r'(FORMAT_EXCEPTION\(.*?PyExc.*?);', text, re.DOTALL))
+    return set(blocks)
+
+
+def bench_block_finder(repeat=3):
+    """Times the importer block finder and the regex one it replaced on
+    test_data/posixmodule.c and on a file of calls that raise exceptions
+    from a variable (no PyExc_ in them), where every regex match fails
+    only at the end of the file.
+    Returns the best time of each, in milliseconds.
+    """
+    from cpython_importer import CPythonExceptionImporter
+
+    with open('./test_data/posixmodule.c') as f:
+        posixmodule = f.read()
+    no_pyexc = 'PyErr_Format(state->error, "bad value: %d", value);\n' * 2000
+
+    def best_ms(func, text):
+        return min(timeit.repeat(lambda: func(text), number=1,
+                                 repeat=repeat)) * 1e3
+
+    return {'scanner_posixmodule_ms': best_ms(
+                CPythonExceptionImporter.c_block_finder, posixmodule),
+            'regex_posixmodule_ms': best_ms(regex_block_finder, posixmodule),
+            'scanner_no_pyexc_ms': best_ms(
+                CPythonExceptionImporter.c_block_finder, no_pyexc),
+            'regex_no_pyexc_ms': best_ms(regex_block_finder, no_pyexc),
+            'posixmodule_bytes': len(posixmodule),
+            'no_pyexc_bytes': len(no_pyexc)}
+
+
+if __name__ == "__main__":
+    import argparse
+    import platform
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--db", default='./exc_db.pickle',
+                        help='path to the exceptions db filename')
+    parser.add_argument("--samples", type=int, default=200,
+                        help='number of messages to translate')
+    parser.add_argument("--scales", default='1,10,100',
+                        help='comma separated sizes of the synthetic '
+                             'databases, as multiples of the db')
+    parser.add_argument("--json",
+                        help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    exc_db = load_exc_db(args.db)
+    trans_db = synthetic_translations(exc_db)
+    samples = sample_messages(exc_db, args.samples)
+    results = {}
+
+    result = results['cold_warm'] = bench_cold_warm(exc_db, trans_db, samples)
+    print("%d templates, %d messages" % (len(exc_db.all()), len(samples)))
+    print("cold translate: %8.1f us/message" % result['cold_us'])
+    print("warm translate: %8.1f us/message" % result['warm_us'])
+
+    result = results['activate'] = bench_activate()
+    print("activate():                    %8.1f ms" % result['eager_ms'])
+    print("activate(lazy=True):           %8.1f ms" % result['lazy_ms'])
+    print("activate(background=True):     %8.1f ms" % result['background_ms'])
+    print("first exception after lazy:    %8.1f ms" % result['lazy_first_exception_ms'])
+
+    result = results['load'] = bench_load()
+    print("load pickles + translator:     %8.1f ms (%d bytes)"
+          % (result['pickle_ms'], result['pickle_bytes']))
+    print("load compact + translator:     %8.1f ms (%d bytes)"
+          % (result['compact_ms'], result['compact_bytes']))
+
+    result = results['language_switch'] = bench_language_switch(exc_db, samples)
+    print("switch language + translate:   %8.1f us" % result['switch_and_translate_us'])
+    print("exc_i18n.set_language_code():  %8.1f us" % result['set_language_code_us'])
+
+    result = results['pathological'] = bench_pathological()
+    print("worst match, typed patterns:   %8.2f ms" % result['typed_max_ms'])
+    print("worst match, untyped (.*?):    %8.2f ms" % result['untyped_max_ms'])
+
+    result = results['daemon'] = bench_daemon(exc_db, trans_db, samples)
+    print("daemon, one message/request:   %8.0f msg/s" % result['single_msgs_per_s'])
+    print("daemon, batched requests:      %8.0f msg/s" % result['batched_msgs_per_s'])
+    print("daemon, pipelined batches:     %8.0f msg/s" % result['pipelined_msgs_per_s'])
+
+    result = results['prefork'] = bench_prefork(samples)
+    for mode in ('load_in_workers', 'activate_pickles', 'preload_compact',
+                 'frozen_pickles', 'frozen_compact'):
+        print("worker memory, %-17s Rss %6d kB, Pss %6d kB, private %6d kB"
+              % (mode + ':', result[mode]['rss_kb'], result[mode]['pss_kb'],
+                 result[mode]['private_kb']))
+
+    factors = [int(factor) for factor in args.scales.split(',')]
+    result = results['scaling'] = bench_scaling(exc_db, args.samples, factors)
+    for scale, scale_result in result.items():
+        print("%s (%d templates), build %.0f ms, filter(name) %.1f us, "
+              "get() %.1f us" % (scale, scale_result['templates'],
+                                 scale_result['build_ms'],
+                                 scale_result['database']['filter_name_us'],
+                                 scale_result['database']['get_us']))
+        for kind, latency in sorted(scale_result['translate'].items()):
+            print("    translate %-15s p50 %8.1f us, p90 %8.1f us, "
+                  "p99 %8.1f us" % (kind + ':', latency['p50_us'],
+                                    latency['p90_us'], latency['p99_us']))
+
+    result = results['import_parallel'] = bench_import_parallel()
+    print("import %d files, 1 process:    %8.2f s"
+          % (result['files'], result['serial_s']))
+    print("import %d files, %d processes:  %8.2f s (x%.2f, %s CPUs)"
+          % (result['files'], result['jobs'], result['parallel_s'],
+             result['speedup'], result['cpus']))
+
+    result = results['block_finder'] = bench_block_finder()
+    print("block finder, posixmodule.c:   %8.2f ms (regexes: %.2f ms)"
+          % (result['scanner_posixmodule_ms'], result['regex_posixmodule_ms']))
+    print("block finder, no PyExc_:       %8.2f ms (regexes: %.2f ms)"
+          % (result['scanner_no_pyexc_ms'], result['regex_no_pyexc_ms']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'templates': len(exc_db.all()),
+                       'samples': len(samples),
+                       'results': results}, f, indent=2, sort_keys=True)
+        print("results written to %s" % args.json)
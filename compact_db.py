@@ -0,0 +1,306 @@
+"""Compact, memory-mappable binary format for the exception and translation
+databases.
+
+Like a .mo file, a compact database is a header, a table of records and a
+string table::
+
+    header   magic, version, record count, fields per record,
+             offset of the records table, offset of the string table
+    records  for every record and field, the (offset, length) of its utf-8
+             string in the string table. Records are sorted by their fields.
+    strings  every distinct string, utf-8 encoded
+
+The file is opened with mmap and lookups binary search the sorted records,
+decoding only the strings they return.
+"""
+
+import mmap
+import pickle
+import struct
+
+from database import ExceptionDatabase, ExceptionObj, TranslationDatabase, \
+                     TranslationObj
+
+description = 'Converts a pickled database to the compact binary format'
+
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+ENTRY = struct.Struct('<II')
+
+EXCEPTIONS_MAGIC = b'EXDB'
+TRANSLATIONS_MAGIC = b'TRDB'
+
+
+class CompactTable(object):
+    "Read-only view of the sorted records of a mmap'd compact database"
+
+    def __init__(self, fobj, magic):
+        self._mmap = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._mmap, 0)
+        if header[0] != magic or header[1] != VERSION:
+            self._mmap.close()
+            raise ValueError('%r is not a compact database of type %r'
+                             % (getattr(fobj, 'name', fobj), magic))
+        self.count, self.fields, self._records, self._strings = header[2:]
+
+    def __len__(self):
+        return self.count
+
+    def field(self, index, field):
+        "returns the utf-8 bytes of a field of the record at index"
+        offset, length = ENTRY.unpack_from(
+            self._mmap, self._records + (index * self.fields + field) * ENTRY.size)
+        start = self._strings + offset
+        return self._mmap[start:start + length]
+
+    def rows(self, start, stop):
+        """returns the fields of the records from start to stop, as tuples
+        of utf-8 bytes, reading their entries in one pass"""
+        begin = self._records + start * self.fields * ENTRY.size
+        end = self._records + stop * self.fields * ENTRY.size
+        # slicing bytes is cheaper than slicing the mmap
+        strings = self._mmap[self._strings:]
+        values = [strings[offset:offset + length] for offset, length
+                  in ENTRY.iter_unpack(self._mmap[begin:end])]
+        return list(zip(*[iter(values)] * self.fields))
+
+    def key(self, index, size):
+        return tuple(self.field(index, field) for field in range(size))
+
+    def record(self, index):
+        return tuple(self.field(index, field).decode('utf-8')
+                     for field in range(self.fields))
+
+    def bisect_left(self, key, lo=0):
+        "returns the first index whose leading fields are >= key"
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid, len(key)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, key, lo=0):
+        "returns the first index whose leading fields are > key"
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key < self.key(mid, len(key)):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def distinct(self):
+        "yields the distinct values of the first field, as bytes"
+        index = 0
+        while index < self.count:
+            value = self.field(index, 0)
+            yield value
+            index = self.bisect_right((value,), index)
+
+    def close(self):
+        self._mmap.close()
+
+
+def write_table(fobj, magic, records):
+    "writes the records (tuples of str) as a compact table to fobj"
+    records = sorted(tuple(field.encode('utf-8') for field in record)
+                     for record in records)
+    fields = len(records[0]) if records else 0
+    strings = bytearray()
+    offsets = {}
+    entries = []
+    for record in records:
+        for value in record:
+            if value not in offsets:
+                offsets[value] = len(strings)
+                strings.extend(value)
+            entries.append(ENTRY.pack(offsets[value], len(value)))
+
+    records_offset = HEADER.size
+    strings_offset = records_offset + ENTRY.size * len(entries)
+    fobj.write(HEADER.pack(magic, VERSION, len(records), fields,
+                           records_offset, strings_offset))
+    fobj.write(b''.join(entries))
+    fobj.write(strings)
+
+
+class CompactExceptionDatabase(object):
+    """Read-only ExceptionDatabase backed by a compact file. Records are
+    sorted by (name, text).
+    """
+
+    def __init__(self, fobj):
+        self._table = CompactTable(fobj, EXCEPTIONS_MAGIC)
+        self._all = None
+
+    @classmethod
+    def load(cls, path):
+        # the mapping stays valid after the file is closed
+        with open(path, 'rb') as f:
+            return cls(f)
+
+    @staticmethod
+    def dump(db, fobj):
+        write_table(fobj, EXCEPTIONS_MAGIC, db.all())
+
+    def _range(self, start, stop):
+        return {ExceptionObj(*self._table.record(index))
+                for index in range(start, stop)}
+
+    def all(self):
+        if self._all is None:
+            self._all = self._range(0, len(self._table))
+        return self._all
+
+    @property
+    def exceptions(self):
+        return self.all()
+
+    def names(self):
+        return {name.decode('utf-8') for name in self._table.distinct()}
+
+    def filter(self, name=None, names=None, prefix=None):
+        "same as ExceptionDatabase.filter"
+        if name is None and names is None and prefix is None:
+            return set(self.all())
+        if name is not None:
+            selected = [name] if names is None or name in names else []
+        elif names is not None:
+            selected = set(names)
+        else:
+            selected = None
+        if prefix is not None and selected is not None:
+            selected = [n for n in selected if n.startswith(prefix)]
+
+        table = self._table
+        if selected is None:
+            # every name starting with prefix is in a contiguous run
+            encoded = prefix.encode('utf-8')
+            start = stop = table.bisect_left((encoded,))
+            while stop < len(table) and table.field(stop, 0).startswith(encoded):
+                stop += 1
+            return self._range(start, stop)
+        result = set()
+        for n in selected:
+            key = (n.encode('utf-8'),)
+            result.update(self._range(table.bisect_left(key),
+                                      table.bisect_right(key)))
+        return result
+
+    def close(self):
+        self._table.close()
+
+
+class CompactTranslationDatabase(object):
+    """Read-only TranslationDatabase backed by a compact file. Records are
+    stored as (language_code, exc_name, exc_text, translation).
+    """
+
+    def __init__(self, fobj):
+        self._table = CompactTable(fobj, TRANSLATIONS_MAGIC)
+        self._all = None
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f)
+
+    @staticmethod
+    def dump(db, fobj):
+        write_table(fobj, TRANSLATIONS_MAGIC,
+                    ((t.language_code, t.exc_name, t.exc_text, t.translation)
+                     for t in db.all()))
+
+    def _translation(self, index):
+        language_code, exc_name, exc_text, translation = self._table.record(index)
+        return TranslationObj(exc_name, exc_text, language_code, translation)
+
+    def all(self):
+        if self._all is None:
+            self._all = {self._translation(index)
+                         for index in range(len(self._table))}
+        return self._all
+
+    @property
+    def translations(self):
+        return self.all()
+
+    def languages(self):
+        return {lang.decode('utf-8') for lang in self._table.distinct()}
+
+    def get(self, exc_name, exc_text, lang):
+        key = (lang.encode('utf-8'), exc_name.encode('utf-8'),
+               exc_text.encode('utf-8'))
+        index = self._table.bisect_left(key)
+        if index < len(self._table) and self._table.key(index, 3) == key:
+            return self._translation(index)
+        return None
+
+    def get_many(self, keys, lang):
+        """same as TranslationDatabase.get_many. The records of a language
+        are contiguous: many keys are looked up in one scan of them instead
+        of a binary search each"""
+        keys = list(keys)
+        table = self._table
+        encoded = (lang.encode('utf-8'),)
+        start = table.bisect_left(encoded)
+        stop = table.bisect_right(encoded, start)
+        # for a few keys a binary search each is still cheaper
+        if len(keys) * (stop - start).bit_length() < stop - start:
+            return [self.get(exc_name, exc_text, lang)
+                    for exc_name, exc_text in keys]
+        translations = {(exc_name, exc_text): translation for
+                        language_code, exc_name, exc_text, translation
+                        in table.rows(start, stop)}
+        result = []
+        for exc_name, exc_text in keys:
+            translation = translations.get((exc_name.encode('utf-8'),
+                                            exc_text.encode('utf-8')))
+            if translation is None:
+                result.append(None)
+            else:
+                result.append(TranslationObj(exc_name, exc_text, lang,
+                                             translation.decode('utf-8')))
+        return result
+
+    def close(self):
+        self._table.close()
+
+
+def is_compact(path):
+    "returns True if the file at path is in the compact format"
+    with open(path, 'rb') as f:
+        return f.read(4) in (EXCEPTIONS_MAGIC, TRANSLATIONS_MAGIC)
+
+
+def convert(pickle_path, out_path):
+    """Converts a pickled ExceptionDatabase or TranslationDatabase to the
+    compact format. Returns the class of the converted database.
+    """
+    with open(pickle_path, 'rb') as f:
+        data = pickle.load(f)
+    if any(isinstance(item, TranslationObj) for item in data):
+        db, compact_cls = TranslationDatabase(data), CompactTranslationDatabase
+    else:
+        db, compact_cls = ExceptionDatabase(data), CompactExceptionDatabase
+    with open(out_path, 'wb') as f:
+        compact_cls.dump(db, f)
+    return compact_cls
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("db",
+                        help='path to the pickled db filename')
+    parser.add_argument("outfile",
+                        help='output filename')
+    args = parser.parse_args()
+
+    compact_cls = convert(args.db, args.outfile)
+    print('%s written to %s' % (compact_cls.__name__, args.outfile))
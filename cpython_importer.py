@@ -1,8 +1,15 @@
+import io
 import re
 import os
 import sys
 import glob
 import pickle
+import hashlib
+import tarfile
+import functools
+import threading
+import subprocess
+from multiprocessing import Pool
 from database import ExceptionDatabase, ExceptionObj
 
 description = 'Builds a database of exceptions from CPython source'
@@ -11,12 +18,87 @@ description = 'Builds a database of exceptions from CPython source'
 class ParseError(Exception):
     pass
 
+
+# calls that raise an exception with a message
+EXCEPTION_MACROS = ('PyErr_SetString', 'PyErr_Format', 'FORMAT_EXCEPTION')
+
+# comments, string and char literals, skipped as a whole by the scanners.
+# Every alternative of the scanners starts with a literal character, so the
+# regex engine skips fast to the next one; the match kind is told by its
+# first character.
+C_SKIPPED = (r'/\*.*?\*/', r'//[^\n]*',
+             r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"',
+             r"'[^'\\\n]*(?:\\.[^'\\\n]*)*'")
+
+# outside of a call only the macros are looked for, inside of one the
+# parenthesis and the exception types
+C_CALL_ARGS = re.compile('|'.join(C_SKIPPED + (r'PyExc_\w+', r'\(', r'\)')),
+                         re.DOTALL)
+
+# the opening parenthesis after a macro name
+C_CALL_START = re.compile(r'(?:\s|/\*.*?\*/|//[^\n]*)*\(', re.DOTALL)
+
+@functools.lru_cache()
+def _macro_scanner(macros):
+    names = tuple(re.escape(name) + r'\b' for name in macros)
+    return re.compile('|'.join(C_SKIPPED + names), re.DOTALL)
+
+
+def blob_hash(data):
+    "returns the git blob hash (hex sha1) of the bytes data"
+    header = ('blob %d\0' % len(data)).encode('ascii')
+    return hashlib.sha1(header + data).hexdigest()
+
+
+class ImportManifest(object):
+    """Blob hash and exceptions of every source file of the last import, so
+    the next one only parses the files whose content changed.
+
+    files maps the '/' separated path of every file to (blob hash,
+    frozenset of ExceptionObj). macros are the ones the files were parsed
+    with, the files are parsed again if they change.
+    """
+
+    def __init__(self, files=None, macros=None):
+        self.files = files if files else {}
+        self.macros = macros
+
+    def by_blob(self):
+        "returns the exceptions of every blob hash known"
+        return {blob: exceptions for blob, exceptions in self.files.values()}
+
+    def exceptions(self):
+        "returns the exceptions of every file"
+        result = set()
+        for blob, exceptions in self.files.values():
+            result.update(exceptions)
+        return result
+
+    def dump(self, fobj):
+        pickle.dump({'files': self.files, 'macros': self.macros}, fobj)
+
+    @classmethod
+    def load_from_pickle(cls, file_obj):
+        data = pickle.load(file_obj)
+        return cls(data['files'], data['macros'])
+
+
 class CPythonExceptionImporter(object):
     """Extracts exceptions from the CPython sourcecode.
     """
 
-    def __init__(self, path):
+    # directories whose C files are imported, and files left out
+    SOURCE_DIRS = ('Python', 'Objects', 'Modules')
+    EXCLUDED = ('Python/errors.c',)
+
+    def __init__(self, path, macros=EXCEPTION_MACROS, ref=None):
+        # with a ref, path is a git repository and the files are read from
+        # the tree of ref
         self.path = path
+        self.ref = ref
+        self.macros = tuple(macros)
+        # files parsed, reused and removed by the last do_import()
+        self.stats = None
 
     @staticmethod
     def parse_c_code(text):
@@ -28,21 +110,66 @@ class CPythonExceptionImporter(object):
         return ExceptionObj(exc_type, text_error)
 
     @staticmethod
-    def c_block_finder(text):
-        """Splits C code in blocks that contains one Exception
+    def c_block_finder(text, macros=EXCEPTION_MACROS):
+        """Splits C code in blocks that contains one Exception: the calls
+        to one of macros with a PyExc_ argument, from the macro name to the
+        closing parenthesis, in source order.
+
+        The text is scanned once. Comments and string and char literals are
+        skipped, so a macro name or a parenthesis inside of them doesn't
+        count, and nested parenthesis are matched.
         """
-        blocks = re.findall(r'(PyErr_SetString.*?);', text, re.DOTALL)
-        blocks.extend(re.findall('(PyErr_Format\(.*?PyExc.*?);', text, re.DOTALL))
-        blocks.extend(re.findall('(FORMAT_EXCEPTION\(.*?PyExc.*?);', text, re.DOTALL))
+        macro_scanner = _macro_scanner(tuple(macros))
+        blocks = []
+        pos = 0
+        while True:
+            m = macro_scanner.search(text, pos)
+            if m is None:
+                return blocks
+            pos = m.end()
+            before = text[m.start() - 1] if m.start() else ' '
+            if text[m.start()] in '/"\'' or before.isalnum() or before == '_':
+                continue
+            start = C_CALL_START.match(text, pos)
+            if start is None:
+                continue
 
-        return set(blocks)
+            # the arguments, up to the matching parenthesis
+            depth = 1
+            has_exc = False
+            for m_arg in C_CALL_ARGS.finditer(text, start.end()):
+                char = text[m_arg.start()]
+                if char == '(':
+                    depth += 1
+                elif char == ')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                elif char == 'P':
+                    has_exc = True
+            else:
+                # unbalanced, the file ends inside the call
+                return blocks
+            pos = m_arg.end()
+            if has_exc:
+                blocks.append(text[m.start():pos])
 
     @staticmethod
-    def parse_c_file(filename):
-        exceptions = set()
+    def parse_c_file(filename, macros=EXCEPTION_MACROS):
         with open(filename) as f:
             text = f.read()
-        blocks = CPythonExceptionImporter.c_block_finder(text)
+        return CPythonExceptionImporter.parse_c_text(text, filename, macros)
+
+    @staticmethod
+    def parse_c_data(data, filename, macros=EXCEPTION_MACROS):
+        "same as parse_c_file, on the bytes data read from filename"
+        text = io.TextIOWrapper(io.BytesIO(data)).read()
+        return CPythonExceptionImporter.parse_c_text(text, filename, macros)
+
+    @staticmethod
+    def parse_c_text(text, filename, macros=EXCEPTION_MACROS):
+        exceptions = set()
+        blocks = CPythonExceptionImporter.c_block_finder(text, macros)
         for block in blocks:
             try:
                 exception_obj = CPythonExceptionImporter.parse_c_code(block)
@@ -52,15 +179,169 @@ class CPythonExceptionImporter(object):
 
         return exceptions
 
-    def do_import(self):
-        exceptions = set()
-        filenames = glob.glob(os.path.join(self.path, 'Python', '*.c'))
-        filenames.extend(glob.glob(os.path.join(self.path, 'Objects', '*.c')))
-        filenames.extend(glob.glob(os.path.join(self.path, 'Modules', '*.c')))
-        filenames.remove(os.path.join(self.path, 'Python', 'errors.c'))
-        for filename in filenames:
-            exceptions.update(self.parse_c_file(filename))
+    @classmethod
+    def is_source_file(cls, name):
+        "tells if name, a '/' separated path in the source tree, is imported"
+        directory, _, filename = name.rpartition('/')
+        return directory in cls.SOURCE_DIRS and filename.endswith('.c') \
+               and name not in cls.EXCLUDED
+
+    def source_files(self):
+        "returns the sorted '/' separated paths of the files to import"
+        names = []
+        for directory in self.SOURCE_DIRS:
+            for filename in glob.glob(os.path.join(self.path, directory, '*.c')):
+                names.append(directory + '/' + os.path.basename(filename))
+        return sorted(name for name in names if self.is_source_file(name))
+
+    def sources(self, known=()):
+        """yields the (name, blob hash, bytes) of every file to import, from
+        the source tree, from the members of path if it's a tarball or from
+        the git repository at path if a ref was given. bytes is None for the
+        files whose blob hash is in known, if the source can tell them
+        without reading them."""
+        if self.ref is not None:
+            yield from self.git_sources(self.path, self.ref, known)
+            return
+        if os.path.isfile(self.path) and tarfile.is_tarfile(self.path):
+            yield from self.tar_sources(self.path)
+            return
+        for name in self.source_files():
+            with open(os.path.join(self.path, *name.split('/')), 'rb') as f:
+                data = f.read()
+            yield name, blob_hash(data), data
+
+    @classmethod
+    def tar_name(cls, member_name):
+        """returns the path in the source tree of a tarball member, which
+        is usually under a top directory like Python-3.3.2/"""
+        name = member_name[2:] if member_name.startswith('./') else member_name
+        if cls.is_source_file(name):
+            return name
+        return name.partition('/')[2]
+
+    def tar_sources(self, archive):
+        """yields the (name, blob hash, bytes) of every file to import from
+        a tarball (.tar, .tar.gz, .tar.bz2 or .tar.xz), reading it once as a
+        stream, in the order of its members"""
+        with tarfile.open(archive, 'r|*') as tar:
+            for member in tar:
+                name = self.tar_name(member.name)
+                if member.isfile() and self.is_source_file(name):
+                    data = tar.extractfile(member).read()
+                    yield name, blob_hash(data), data
+
+    @staticmethod
+    def _git(repo, *args, **kwargs):
+        # never fetch missing objects from a remote (eg. in partial clones)
+        return subprocess.Popen(('git', '-C', repo,
+                                 '-c', 'protocol.allow=never') + args,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                **kwargs)
 
+    def git_sources(self, repo, ref, known=()):
+        """yields the (name, blob hash, bytes) of every file to import from
+        the tree of ref in a local git repository (a bare one or a clone),
+        without a checkout. The blob hashes come from
+        the tree, so the blobs in known are not read; the rest are read
+        through a single git cat-file --batch process.
+        """
+        ls_tree = self._git(repo, 'ls-tree', '-z', '--full-tree', ref, '--',
+                            *[directory + '/' for directory in self.SOURCE_DIRS])
+        out, err = ls_tree.communicate()
+        if ls_tree.returncode:
+            raise ValueError("can't read the tree of %s in %s: %s"
+                             % (ref, repo, err.decode('utf-8', 'replace').strip()))
+        entries = []
+        for line in out.decode('utf-8').split('\0'):
+            if not line:
+                continue
+            info, name = line.split('\t', 1)
+            mode, kind, blob = info.split()
+            if kind == 'blob' and self.is_source_file(name):
+                entries.append((name, blob))
+        entries.sort()
+
+        missing = [blob for name, blob in entries if blob not in known]
+        cat_file = self._git(repo, 'cat-file', '--batch', stdin=subprocess.PIPE)
+        # fed from a thread, so neither pipe fills up while the other waits
+        def feed():
+            try:
+                for blob in missing:
+                    cat_file.stdin.write(blob.encode('ascii') + b'\n')
+            except OSError:
+                # git exited early, the reader reports it
+                pass
+            finally:
+                try:
+                    cat_file.stdin.close()
+                except OSError:
+                    pass
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        try:
+            for name, blob in entries:
+                if blob in known:
+                    yield name, blob, None
+                    continue
+                header = cat_file.stdout.readline().split()
+                if len(header) != 3 or header[0].decode('ascii') != blob:
+                    raise ValueError("can't read blob %s of %s in %s"
+                                     % (blob, name, repo))
+                data = cat_file.stdout.read(int(header[2]))
+                cat_file.stdout.read(1)
+                yield name, blob, data
+        finally:
+            cat_file.stdout.close()
+            feeder.join()
+            cat_file.wait()
+            cat_file.stderr.close()
+
+    def update_manifest(self, manifest, jobs=1):
+        """Makes manifest describe the sources: parses the files whose blob
+        hash the manifest doesn't know, reuses the exceptions of the rest and
+        drops the files that are gone. With jobs > 1 the files are parsed by
+        a pool of jobs processes.
+        Returns how many files were parsed, reused and removed.
+        """
+        known = manifest.by_blob() if manifest.macros == self.macros else {}
+        files = {}
+        to_parse = []
+        for name, blob, data in self.sources(known):
+            if blob in known:
+                files[name] = (blob, known[blob])
+            else:
+                to_parse.append((name, blob, data))
+
+        args = [(data, name, self.macros) for name, blob, data in to_parse]
+        if jobs > 1 and len(args) > 1:
+            with Pool(jobs) as pool:
+                # results come back in the order of args
+                results = pool.starmap(self.parse_c_data, args,
+                                       chunksize=max(1, len(args) // (jobs * 4)))
+        else:
+            results = [self.parse_c_data(*arg) for arg in args]
+        for (name, blob, data), exceptions in zip(to_parse, results):
+            files[name] = (blob, frozenset(exceptions))
+
+        stats = {'parsed': len(to_parse),
+                 'reused': len(files) - len(to_parse),
+                 'removed': len(set(manifest.files) - set(files))}
+        manifest.files = files
+        manifest.macros = self.macros
+        return stats
+
+    def do_import(self, jobs=1, manifest=None):
+        """returns the exceptions of every source file. With jobs > 1 the
+        files are parsed by a pool of jobs processes. If an ImportManifest
+        of a previous import is given, only the files that changed are
+        parsed and the manifest is updated; the counts of files parsed,
+        reused and removed are left in self.stats.
+        """
+        if manifest is None:
+            manifest = ImportManifest()
+        self.stats = self.update_manifest(manifest, jobs)
+        exceptions = manifest.exceptions()
         exceptions.update(self.fixed_exceptions())
         return exceptions
 
@@ -86,15 +367,41 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument("path",
-                        help='path to CPython source eg: /home/foo/Python-3.3.2')
+                        help='path to CPython source or to a source tarball '
+                             'eg: /home/foo/Python-3.3.2 or Python-3.3.2.tar.xz')
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help='number of worker processes parsing the files')
+    parser.add_argument("--ref",
+                        help='path is a git repository, import the sources of '
+                             'this ref (eg: v3.3.2) without a checkout')
+    parser.add_argument("--macros", default=','.join(EXCEPTION_MACROS),
+                        help='comma separated names of the calls that raise '
+                             'the exceptions')
+    parser.add_argument("--manifest",
+                        help='manifest of the previous import, only the files '
+                             'changed since then are parsed. It is updated')
     args = parser.parse_args()
 
 
-    cpyimporter = CPythonExceptionImporter(args.path)
-    exceptions = cpyimporter.do_import()
+    manifest = None
+    if args.manifest and os.path.exists(args.manifest):
+        with open(args.manifest, 'rb') as f:
+            manifest = ImportManifest.load_from_pickle(f)
+    elif args.manifest:
+        manifest = ImportManifest()
+
+    cpyimporter = CPythonExceptionImporter(args.path,
+                                           args.macros.split(','), args.ref)
+    exceptions = cpyimporter.do_import(jobs=args.jobs, manifest=manifest)
     db = ExceptionDatabase(exceptions)
 
     print("%d Exceptions imported" % len(exceptions))
+    print("%(parsed)d files parsed, %(reused)d unchanged, %(removed)d removed"
+          % cpyimporter.stats)
+    if manifest is not None:
+        with open(args.manifest, 'wb') as f:
+            manifest.dump(f)
+            print('Manifest written to %s' % args.manifest)
     out_filename = './exc_db.pickle'
     with open(out_filename, 'wb') as f:
         db.dump(f)
@@ -11,12 +11,22 @@ TranslationObj = namedtuple("TranslationObj", ['exc_name', 'exc_text', 'language
 class Database(object):
     def __init__(self, data=None):
         self.data = data if data else set()
+        self.build_index()
 
     def all(self):
         return self.data
 
     def add(self, item):
         self.data.add(item)
+        self._index_item(item)
+
+    def build_index(self):
+        "builds the lookup indexes of the subclass from self.data"
+        pass
+
+    def _index_item(self, item):
+        "adds a new item to the lookup indexes of the subclass"
+        pass
 
     def dump(self, fobj):
         pickle.dump(self.data, fobj)
@@ -33,13 +43,35 @@ class ExceptionDatabase(Database):
     def __init__(self, exceptions=None):
         super(ExceptionDatabase, self).__init__(exceptions)
 
-    def filter(self, name=None):
-        def cond(val, name):
-            result = True
-            if name is not None:
-                result = result and val.name == name
-            return result
-        return {exc for exc in self.exceptions if cond(exc, name)}
+    def build_index(self):
+        self._by_name = defaultdict(set)
+        for exc in self.data:
+            self._by_name[exc.name].add(exc)
+
+    def _index_item(self, exc):
+        self._by_name[exc.name].add(exc)
+
+    def names(self):
+        return set(self._by_name)
+
+    def filter(self, name=None, names=None, prefix=None):
+        """returns the exceptions whose name is name, is one of names and
+        starts with prefix (the conditions that are not None)"""
+        if name is None and names is None and prefix is None:
+            return set(self.exceptions)
+        if name is not None:
+            selected = [name] if names is None or name in names else []
+        elif names is not None:
+            selected = set(names)
+        else:
+            selected = self._by_name
+        if prefix is not None:
+            selected = [n for n in selected if n.startswith(prefix)]
+
+        result = set()
+        for n in selected:
+            result.update(self._by_name.get(n, ()))
+        return result
 
     def export_as_po(self, path):
         po = polib.POFile()
@@ -67,14 +99,29 @@ class TranslationDatabase(Database):
     def __init__(self, translations=None):
         super().__init__(translations)
 
+    def build_index(self):
+        self._by_language = defaultdict(dict)
+        for trans in self.data:
+            self._index_item(trans)
+
+    def _index_item(self, trans):
+        key = (trans.exc_name, trans.exc_text)
+        self._by_language[trans.language_code][key] = trans
+
+    def languages(self):
+        return set(self._by_language)
+
     def get(self, exc_name, exc_text, lang):
-        result = None
-        for trans in self.translations:
-            if trans.exc_name == exc_name and trans.exc_text == exc_text \
-              and trans.language_code == lang:
-                result = trans
-                break
-        return result
+        translations = self._by_language.get(lang)
+        if translations is None:
+            return None
+        return translations.get((exc_name, exc_text))
+
+    def get_many(self, keys, lang):
+        """returns the translations of the (exc_name, exc_text) keys in the
+        same order, with None for the missing ones"""
+        translations = self._by_language.get(lang, {})
+        return [translations.get(key) for key in keys]
 
     @property
     def translations(self):
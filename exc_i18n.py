@@ -1,93 +1,685 @@
 # -*- coding: utf-8 -*-
 
+import gc
 import sys
 import re
+import json
+import time
+import threading
 import traceback
+import contextlib
+import contextvars
+from collections import Counter, OrderedDict, namedtuple
 from database import ExceptionDatabase, TranslationDatabase
+from compact_db import CompactExceptionDatabase, CompactTranslationDatabase, \
+                       is_compact
 
 class TranslationMissing(Exception):
-    pass
+    message = 'El mensaje de excepción aún no ha sido traducido. Colabora!'
 
 class TranslationNotSupported(Exception):
-    pass
+    message = 'La excepción no está soportada en el sistema de traducción'
 
 translator = None
 
+# language of the current thread / asyncio task, see use_language()
+_context_language = contextvars.ContextVar('exc_i18n_language_code',
+                                           default=None)
+
+# an item of translate_many(), error is None or the exception class that
+# translate() would have raised
+TranslationResult = namedtuple('TranslationResult',
+                               ['exc_name', 'formatted_msg', 'translation', 'error'])
+
+EXC_DB_PATH = './exc_db.pickle'
+TRANS_DB_PATH = './trans.pickle'
+
+# number of translate() results kept by the translator built by activate()
+DEFAULT_CACHE_SIZE = 1024
+
+# matches a format specifier of a CPython error template (eg. %.200s, %zd)
+# or an escaped percent sign (%%). Translations may also pick the value
+# they format by its position (eg. %2$s)
+FMT_PATTERN = re.compile(r'%(?:%|(?:(?P<position>[1-9]\d*)\$)?'
+                         r'(?P<flags>[-+ #0]*)(?P<width>\d*)'
+                         r'(?:\.(?P<precision>\d+))?(?P<length>ll|l|z|t|j|h)?'
+                         r'(?P<conversion>[cdiuxXpsAUVSR]))')
+
+# what a value formatted by each conversion looks like. The rest (strings
+# and objects) match anything, up to the precision if there is one.
+CONVERSION_PATTERNS = {
+    'd': r'-?\d+',
+    'i': r'-?\d+',
+    'u': r'\d+',
+    'x': r'[0-9a-fA-F]+',
+    'X': r'[0-9a-fA-F]+',
+    'p': r'(?:0x)?[0-9a-fA-F]+',
+    'c': r'.',
+}
+
+def parse_template(text):
+    """returns the literal parts of a template (with %% unescaped) and the
+    match objects of the format specifiers between them"""
+    literals = []
+    specs = []
+    literal = []
+    pos = 0
+    for spec in FMT_PATTERN.finditer(text):
+        literal.append(text[pos:spec.start()])
+        pos = spec.end()
+        if spec.group('conversion') is None:
+            literal.append('%')
+        else:
+            literals.append(''.join(literal))
+            literal = []
+            specs.append(spec)
+    literal.append(text[pos:])
+    literals.append(''.join(literal))
+    return literals, specs
+
+def split_template(text):
+    "returns the literal parts of a template, split by its format specifiers"
+    return parse_template(text)[0]
+
+def spec_pattern(spec):
+    "returns the regex that matches the value formatted by a format specifier"
+    pattern = CONVERSION_PATTERNS.get(spec.group('conversion'))
+    if pattern is None:
+        precision = spec.group('precision')
+        pattern = '.{0,%s}?' % precision if precision else '.*?'
+    elif spec.group('width'):
+        pattern = ' *%s *' % pattern
+    return pattern
+
+def specificity_key(exc):
+    """sort key that puts first the templates with more literal characters,
+    then the ones with fewer format specifiers, then sorts by text"""
+    literals = split_template(exc.text)
+    return (-sum(len(part) for part in literals), len(literals), exc.text)
+
+
+class TemplateMatcher(object):
+    """Finds which one of the templates of an exception name matches a
+    formatted message.
+
+    Templates are indexed in a trie by their leading literal text or, when
+    they start with a format specifier, by their trailing literal text (on a
+    trie of reversed strings). A lookup walks the message once from each end
+    to collect the few templates that can match and only runs their regexes,
+    in the original template order.
+    """
+
+    def __init__(self, templates, regexes):
+        self.templates = list(templates)
+        self.regexes = list(regexes)
+        self._prefixes = {}
+        self._suffixes = {}
+        self._anywhere = []
+        for pos, exc in enumerate(self.templates):
+            literals = split_template(exc.text)
+            if literals[0]:
+                self._insert(self._prefixes, literals[0], pos)
+            elif literals[-1]:
+                self._insert(self._suffixes, reversed(literals[-1]), pos)
+            else:
+                self._anywhere.append(pos)
+
+    @staticmethod
+    def _insert(trie, chars, pos):
+        node = trie
+        for char in chars:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(pos)
+
+    @staticmethod
+    def _walk(trie, chars, found):
+        node = trie
+        for char in chars:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.extend(node[None])
+
+    def candidates(self, formatted_msg):
+        "returns the positions of the templates that may match, in order"
+        found = list(self._anywhere)
+        self._walk(self._prefixes, formatted_msg, found)
+        self._walk(self._suffixes, reversed(formatted_msg), found)
+        found.sort()
+        return found
+
+    def match(self, formatted_msg, stats=None):
+        """returns the matching template and its extracted values, or
+        (None, None). Counts the templates tried in stats, if given"""
+        tried = 0
+        for tried, pos in enumerate(self.candidates(formatted_msg), 1):
+            res = self.regexes[pos].match(formatted_msg)
+            if res:
+                if stats is not None:
+                    stats.candidates[tried] += 1
+                return self.templates[pos], res.groups()
+        if stats is not None:
+            stats.candidates[tried] += 1
+        return None, None
+
+
+class TranslationPlan(object):
+    """A template compiled for one language.
+
+    Holds the regex that matches the messages of the template (None for the
+    templates without format specifiers, matched by text), which of the
+    values it extracts the translation formats (and in which order, as a
+    translation can reorder or drop them) and the translation as a format
+    string of plain %s, as the values are already formatted text.
+    Raises ValueError if the translation formats a value the template
+    doesn't have.
+    """
+
+    __slots__ = ('exc', 'regex', 'arg_map', 'fmt')
+
+    def __init__(self, exc, regex, translation):
+        self.exc = exc
+        self.regex = regex
+        groups = regex.groups if regex else 0
+        literals, specs = parse_template(translation)
+        arg_map = []
+        for pos, spec in enumerate(specs):
+            position = spec.group('position')
+            index = int(position) - 1 if position else pos
+            if index >= groups:
+                raise ValueError('%r formats %d values, the template has %d'
+                                 % (translation, index + 1, groups))
+            arg_map.append(index)
+        # None when the values are formatted as they are extracted
+        self.arg_map = None if arg_map == list(range(groups)) else arg_map
+        self.fmt = '%s'.join(literal.replace('%', '%%') for literal in literals)
+
+    def render(self, values):
+        "returns the translation formatted with the values extracted"
+        if self.arg_map is not None:
+            values = tuple([values[index] for index in self.arg_map])
+        return self.fmt % values
+
+
+class TranslationCache(object):
+    """Bounded LRU cache of translate() results, keyed on
+    (language_code, exc_name, formatted_msg).
+
+    It is shared by threads without a lock: every OrderedDict call is
+    atomic and a race between two of them only costs a miss. The counters
+    are approximate under contention.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        "returns the cached value of key, or None"
+        try:
+            value = self._data[key]
+            self._data.move_to_end(key)
+        except KeyError:
+            # not cached, or evicted by another thread in between
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        try:
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        except KeyError:
+            pass
+
+    def clear(self, language_code=None):
+        "drops every entry, or only the ones of language_code if given"
+        if language_code is None:
+            self._data.clear()
+            return
+        for key in [key for key in list(self._data) if key[0] == language_code]:
+            self._data.pop(key, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._data),
+                'maxsize': self.maxsize}
+
+
+class TranslationStats(object):
+    """Count and cumulative time of every stage of the translation lookups
+    and histogram of the templates tried per lookup.
+
+    The stages are 'literal' (the exact text index), 'match' (the regexes
+    of the candidate templates, only when the text index misses), 'plan'
+    (the TranslationPlan of the language) and 'render'. Like the cache,
+    it is shared by threads without a lock, so under contention the
+    numbers are approximate.
+    """
+
+    STAGES = ('literal', 'match', 'plan', 'render')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lookups = 0
+        self.counts = dict.fromkeys(self.STAGES, 0)
+        self.times = dict.fromkeys(self.STAGES, 0.0)
+        # templates tried per lookup: {tried: lookups}
+        self.candidates = Counter()
+
+    def add(self, stage, elapsed):
+        self.counts[stage] += 1
+        self.times[stage] += elapsed
+
+    def lap(self, stage, start):
+        "adds the time since start to stage and returns the current time"
+        now = time.perf_counter()
+        self.add(stage, now - start)
+        return now
+
+    def as_dict(self):
+        stages = {}
+        for stage in self.STAGES:
+            count = self.counts[stage]
+            stages[stage] = {'count': count, 'total_s': self.times[stage],
+                             'mean_us': self.times[stage] / count * 1e6
+                                        if count else 0.0}
+        return {'lookups': self.lookups, 'stages': stages,
+                'candidates': {str(tried): lookups for tried, lookups
+                               in sorted(self.candidates.items())}}
+
+    def dump(self, path):
+        "writes as_dict() to path as JSON"
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+
 class ExceptionTranslator(object):
 
-    def __init__(self, exc_db, trans_db):
+    def __init__(self, exc_db, trans_db, cache_size=0, stats=False):
         self.exc_db = exc_db
         self.trans_db = trans_db
-        self.language_code = self.detect_language_code()
+        self._language_code = self.detect_language_code()
+        # cache_size=0 disables the cache of translate() results
+        self.cache = TranslationCache(cache_size) if cache_size else None
+        # TranslationPlans of every language loaded, by template. Only
+        # written under _load_lock, read without it.
+        self._plans = {}
+        self._load_lock = threading.Lock()
+        # lookups answered (or not) by the exact text index
+        self.exact_hits = 0
+        self.exact_misses = 0
+        # TranslationStats of the lookups, None when disabled
+        self.stats = TranslationStats() if stats else None
+        self.build_matchers()
 
     def detect_language_code(self):
         #TODO: read actual value from environment
         return 'es'
 
+    @property
+    def language_code(self):
+        """the language chosen for the current context with use_language(),
+        or else the default language of the translator"""
+        return _context_language.get() or self._language_code
+
     def set_language_code(self, language_code):
-        self.language_code = language_code
+        """sets the default language. The plans of every language loaded
+        stay in memory, so switching to one of them only swaps a reference.
+        Cached results are keyed by language and stay valid."""
+        self._get_plans(language_code)
+        self._language_code = language_code
+
+    def _get_plans(self, language_code):
+        "returns the plans of a language, loading it the first time"
+        plans = self._plans.get(language_code)
+        if plans is None:
+            with self._load_lock:
+                plans = self._plans.get(language_code)
+                if plans is None:
+                    plans = self._load_language(language_code)
+        return plans
+
+    def enable_stats(self):
+        "starts recording the TranslationStats of the lookups and returns it"
+        if self.stats is None:
+            self.stats = TranslationStats()
+        return self.stats
+
+    def disable_stats(self):
+        self.stats = None
+
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
 
     def _build_deformating_regex(self, exc):
-        fmt_term_chars = 'sdSzcRxUV'
-        split_pattern = '%%.*?[%s]' % fmt_term_chars
-        # replace every format pattern (eg. %.10s) by .*? so it will match the
-        # actual error with values replaced, and group them to obtain the values
-        re_pattern = "^"+ '(.*?)'.join(re.split(split_pattern, exc.text)) +"$"
-        r = re.compile(re_pattern)
+        # replace every format pattern (eg. %.10s) by a group that matches the
+        # values it formats (eg. .{0,10}?), so it will match the actual error
+        # with values replaced and the groups give back the values.
+        # The literal parts are escaped so templates like "sum() can't sum
+        # strings [...]" don't add groups or fail to compile.
+        literals, specs = parse_template(exc.text)
+        patterns = [spec_pattern(spec) for spec in specs]
+        for i in range(len(patterns) - 1):
+            # of two adjacent unbounded strings (eg. "%s%s") the lazy first
+            # one always ends up empty when there is a match. Making it empty
+            # upfront avoids trying every split of the text on a miss.
+            if patterns[i] == patterns[i + 1] == '.*?' and not literals[i + 1]:
+                patterns[i] = ''
+        re_pattern = "^" + re.escape(literals[0])
+        for pattern, literal in zip(patterns, literals[1:]):
+            re_pattern += "(%s)%s" % (pattern, re.escape(literal))
+        # \Z, not $: $ also matches before a trailing newline, which the
+        # text index and the suffix trie of TemplateMatcher don't
+        r = re.compile(re_pattern + r"\Z", re.DOTALL)
         return r
 
+    def build_matchers(self):
+        """indexes the templates without format specifiers by their text,
+        compiles the deformating regex of the rest and builds a
+        TemplateMatcher for them for every exception name"""
+        self._matchers = {}
+        self._literals = {}
+        by_name = {}
+        for exc in self.exc_db.all():
+            literals = split_template(exc.text)
+            if len(literals) == 1:
+                # matched by its text, the regex is only compiled on demand
+                self._literals[(exc.name, literals[0])] = exc
+            else:
+                self._matchers[exc] = self._build_deformating_regex(exc)
+                by_name.setdefault(exc.name, []).append(exc)
+        # the most specific templates are tried first, so a loose template
+        # like "%s" never shadows a specific one
+        self._index = {}
+        for name, templates in by_name.items():
+            templates.sort(key=specificity_key)
+            self._index[name] = TemplateMatcher(
+                templates, [self._matchers[exc] for exc in templates])
+        # the plans point to the matchers, rebuild every loaded language
+        with self._load_lock:
+            languages = set(self._plans)
+            languages.add(self._language_code)
+            self._plans = {language_code: self._build_plans(language_code)
+                           for language_code in languages}
+
+    def load_language(self, language_code):
+        """compiles the TranslationPlans of language_code and keeps them,
+        replacing the ones already loaded. The cached results of the
+        language are dropped, as they may come from the old plans."""
+        with self._load_lock:
+            return self._load_language(language_code)
+
+    def _load_language(self, language_code):
+        "load_language() for the callers already holding _load_lock"
+        plans = self._build_plans(language_code)
+        self._plans[language_code] = plans
+        if self.cache is not None:
+            self.cache.clear(language_code)
+        return plans
+
+    def _build_plans(self, language_code):
+        """compiles a TranslationPlan for every template that has a
+        translation to language_code. Empty translations and the ones that
+        don't fit their template are left out, as if they were missing."""
+        templates = list(self._literals.values()) + list(self._matchers)
+        translations = self.trans_db.get_many(
+            [(exc.name, exc.text) for exc in templates], language_code)
+        plans = {}
+        for exc, trans in zip(templates, translations):
+            if trans and trans.translation:
+                try:
+                    plans[exc] = TranslationPlan(exc, self._matchers.get(exc),
+                                                 trans.translation)
+                except ValueError:
+                    pass
+        return plans
+
+    def reload(self, exc_db=None, trans_db=None):
+        "replaces the databases (if given) and rebuilds the matchers"
+        if exc_db is not None:
+            self.exc_db = exc_db
+        if trans_db is not None:
+            self.trans_db = trans_db
+        self.build_matchers()
+        self.clear_cache()
+
+    def get_matcher(self, exc):
+        "returns the compiled regex for exc, compiling it if it's not indexed"
+        matcher = self._matchers.get(exc)
+        if matcher is None:
+            matcher = self._matchers[exc] = self._build_deformating_regex(exc)
+        return matcher
+
+    def _search(self, exc_name, formatted_msg, stats=None):
+        """returns the matching template and its extracted values, or
+        (None, None). Records the 'literal' and 'match' stages in stats,
+        if given"""
+        if stats is not None:
+            start = time.perf_counter()
+        exc = self._literals.get((exc_name, formatted_msg))
+        if stats is not None:
+            start = stats.lap('literal', start)
+        if exc is not None:
+            self.exact_hits += 1
+            if stats is not None:
+                stats.candidates[0] += 1
+            return exc, ()
+        self.exact_misses += 1
+        matcher = self._index.get(exc_name)
+        if matcher is None:
+            exc, values = None, None
+            if stats is not None:
+                stats.candidates[0] += 1
+        else:
+            exc, values = matcher.match(formatted_msg, stats)
+        if stats is not None:
+            stats.lap('match', start)
+        return exc, values
+
     def search_exception(self, exc_name, formatted_msg):
-        "returns the original template and the extracted values from the provided error message"
-        exceptions = self.exc_db.filter(name=exc_name)
-        if exceptions:
-            for exc in exceptions:
-                if formatted_msg == exc.text:
-                    return exc
-                else:
-                    r = self._build_deformating_regex(exc)
-                    res = re.match(r, formatted_msg)
-                    if res:
-                        return exc
+        "returns the original template of the provided error message"
+        exc, values = self._search(exc_name, formatted_msg)
+        return exc
 
     def extract_values(self, exc, formatted_msg):
-        r = self._build_deformating_regex(exc)
-        res = re.match(r, formatted_msg)
+        res = self.get_matcher(exc).match(formatted_msg)
         return res.groups()
 
     def search_translation(self, exc):
         translation = self.trans_db.get(exc.name, exc.text, self.language_code)
         return translation
 
+    def _lookup(self, exc_name, formatted_msg, language_code):
+        """returns (translation, None) or (None, error) where error is the
+        exception class translate() raises. Records the time of every stage
+        in self.stats, if enabled"""
+        stats = self.stats
+        if stats is not None:
+            stats.lookups += 1
+        exc, values = self._search(exc_name, formatted_msg, stats)
+        if exc is None:
+            return None, TranslationNotSupported
+        if stats is not None:
+            start = time.perf_counter()
+        plan = self._get_plans(language_code).get(exc)
+        if stats is not None:
+            start = stats.lap('plan', start)
+        if plan is None:
+            return None, TranslationMissing
+        translation = plan.render(values)
+        if stats is not None:
+            stats.lap('render', start)
+        return translation, None
+
+    def _cached_lookup(self, exc_name, formatted_msg, language_code):
+        "same as _lookup(), through the results cache if there is one"
+        if self.cache is None:
+            return self._lookup(exc_name, formatted_msg, language_code)
+        key = (language_code, exc_name, formatted_msg)
+        result = self.cache.get(key)
+        if result is None:
+            result = self._lookup(exc_name, formatted_msg, language_code)
+            self.cache.put(key, result)
+        return result
+
     def translate(self, exc_name, formatted_msg):
-        exc = self.search_exception(exc_name, formatted_msg)
-        if exc:
-            trans = self.search_translation(exc)
-            if trans:
-                values = self.extract_values(exc, formatted_msg)
-                return trans.translation % values
-            else:
-                raise(TranslationMissing('El mensaje de excepción aún no ha sido traducido. Colabora!'))
-        else:
-            raise(TranslationNotSupported('La excepción no está soportada en el sistema de traducción'))
+        translation, error = self._cached_lookup(exc_name, formatted_msg,
+                                                 self.language_code)
+        if error:
+            raise(error(error.message))
+        return translation
+
+    def translate_many(self, items):
+        """Translates an iterable of (exc_name, formatted_msg) pairs.
+
+        The pairs are grouped by exception name and every distinct message is
+        resolved once, through the results cache like translate(). Yields a
+        TranslationResult for every pair, in the input order; misses are
+        reported in its error field instead of raised.
+        """
+        items = list(items)
+        groups = OrderedDict()
+        for exc_name, formatted_msg in items:
+            groups.setdefault(exc_name, OrderedDict())[formatted_msg] = None
+
+        language_code = self.language_code
+        for exc_name, messages in groups.items():
+            for msg in messages:
+                messages[msg] = self._cached_lookup(exc_name, msg,
+                                                    language_code)
+
+        for exc_name, formatted_msg in items:
+            translation, error = groups[exc_name][formatted_msg]
+            yield TranslationResult(exc_name, formatted_msg, translation, error)
 
     def show_translation(self):
         pass
 
+def set_context_language(language_code):
+    """sets the language of the current context (thread or asyncio task)
+    only, over the default language of the translator. Returns the
+    contextvars token to undo it."""
+    return _context_language.set(language_code)
+
+@contextlib.contextmanager
+def use_language(language_code):
+    "uses language_code in the current context inside the with block"
+    token = _context_language.set(language_code)
+    try:
+        yield
+    finally:
+        _context_language.reset(token)
+
 def i18n_hook(etype, value, tb):
-    trans_message = translator.translate(etype.__name__, value.args[0])
+    trans_message = get_translator().translate(etype.__name__, value.args[0])
     sys.stderr.write("%s: %s\n" % (etype.__name__, trans_message))
     sys.stderr.flush()
 
-def activate():
+def _load_database(path, db_cls, compact_cls):
+    if is_compact(path):
+        return compact_cls.load(path)
+    with open(path, 'rb') as f:
+        return db_cls.load_from_pickle(f)
+
+def load_databases(exc_db_path=EXC_DB_PATH, trans_db_path=TRANS_DB_PATH):
+    """returns the exceptions and translations databases stored in the
+    files, either pickles or in the compact format"""
+    exc_db = _load_database(exc_db_path, ExceptionDatabase,
+                            CompactExceptionDatabase)
+    trans_db = _load_database(trans_db_path, TranslationDatabase,
+                              CompactTranslationDatabase)
+    return exc_db, trans_db
+
+_load_lock = threading.Lock()
+# language set before a lazy activate() loaded the translator
+_language_code = None
+
+def get_translator():
+    """returns the active translator, loading the databases first if
+    activate() was lazy and they are not loaded yet"""
     global translator
-    with open('./exc_db.pickle', 'rb') as f:
-        exc_db = ExceptionDatabase.load_from_pickle(f)
-    with open('./trans.pickle', 'rb') as f:
-        trans_db = TranslationDatabase.load_from_pickle(f)
+    if translator is None:
+        with _load_lock:
+            if translator is None:
+                exc_db, trans_db = load_databases()
+                new_translator = ExceptionTranslator(
+                    exc_db, trans_db, cache_size=DEFAULT_CACHE_SIZE)
+                if _language_code:
+                    new_translator.set_language_code(_language_code)
+                translator = new_translator
+    return translator
 
-    translator = ExceptionTranslator(exc_db, trans_db)
+def activate(lazy=False, background=False):
+    """Installs i18n_hook as sys.excepthook.
+
+    The databases are loaded right away unless lazy is True, then they are
+    loaded by the first uncaught exception. With background=True they are
+    loaded on a daemon thread and activate() returns immediately.
+    """
+    global translator
+    translator = None
     sys.excepthook = i18n_hook
+    if background:
+        threading.Thread(target=get_translator, daemon=True).start()
+    elif not lazy:
+        get_translator()
 
 def set_language_code(language_code):
-    activate()
-    translator.set_language_code(language_code)
+    """switches the language of the active translator, activating the
+    translation first if needed. The databases are not reloaded."""
+    global _language_code
+    if sys.excepthook is not i18n_hook:
+        activate()
+    with _load_lock:
+        _language_code = language_code
+        if translator is not None:
+            translator.set_language_code(language_code)
+
+def preload(language_codes=(), exc_db_path=EXC_DB_PATH,
+            trans_db_path=TRANS_DB_PATH, freeze=False):
+    """Activates the translation in the master process of a pre-forking
+    server, before the workers are forked, so they inherit a ready
+    translator instead of loading one each.
+
+    Loads the databases and builds the translator and the plans of
+    language_codes. Only the records of compact databases are in a shared
+    read-only segment (their mmap); the indexes of the translator (the
+    literal texts, the TemplateMatchers, the regexes and the plans) are
+    heap objects the workers share copy-on-write, and a page is copied
+    into a worker as soon as a lookup touches an object in it.
+
+    With freeze=True the whole heap of the process is moved to the gc
+    permanent generation (gc.freeze()), so the collections of the workers
+    don't copy those pages too. It is left frozen, call gc.unfreeze() to
+    undo it.
+    """
+    global translator
+    sys.excepthook = i18n_hook
+    with _load_lock:
+        exc_db, trans_db = load_databases(exc_db_path, trans_db_path)
+        new_translator = ExceptionTranslator(
+            exc_db, trans_db, cache_size=DEFAULT_CACHE_SIZE)
+        for language_code in language_codes:
+            new_translator.load_language(language_code)
+        if _language_code:
+            new_translator.set_language_code(_language_code)
+        translator = new_translator
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    return translator
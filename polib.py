@@ -1128,10 +1128,10 @@ class _POFileParser(object):
         enc = kwargs.get('encoding', default_encoding)
         if os.path.exists(pofile):
             try:
-                self.fhandle = codecs.open(pofile, 'rU', enc)
+                self.fhandle = codecs.open(pofile, 'r', enc)
             except LookupError:
                 enc = default_encoding
-                self.fhandle = codecs.open(pofile, 'rU', enc)
+                self.fhandle = codecs.open(pofile, 'r', enc)
         else:
             self.fhandle = pofile.splitlines()
 
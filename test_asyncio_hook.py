@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import asyncio
+import threading
+import unittest
+
+import asyncio_hook
+import exc_i18n
+from database import ExceptionDatabase, ExceptionObj, TranslationDatabase, TranslationObj
+
+exc_db = ExceptionDatabase()
+exc_db.add(ExceptionObj(name="NameError", text="name %s is not defined"))
+
+trans_db = TranslationDatabase()
+trans_db.add(TranslationObj(exc_name="NameError", exc_text="name %s is not defined", language_code="es", translation="el nombre %s no ha sido definido"))
+
+
+class AsyncioHandlerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.translator = exc_i18n.translator
+        self.contexts = []
+
+    def tearDown(self):
+        exc_i18n.translator = self.translator
+
+    def record(self, loop, context):
+        self.contexts.append(context)
+
+    def run_handler(self, exception):
+        async def main():
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(self.record)
+            handler = asyncio_hook.install()
+            self.assertIs(loop.get_exception_handler(), handler)
+            loop.call_exception_handler({'message': 'Task exception was never retrieved',
+                                         'exception': exception})
+            while not self.contexts:
+                await asyncio.sleep(0.01)
+        asyncio.run(asyncio.wait_for(main(), 10))
+        return self.contexts[0]
+
+    def test_translates_message(self):
+        exc_i18n.translator = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+        context = self.run_handler(NameError("name 'a' is not defined"))
+        self.assertEqual(context['message'], "Task exception was never retrieved\n"
+                                             "NameError: el nombre 'a' no ha sido definido")
+
+    def test_fallback_on_miss(self):
+        exc_i18n.translator = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+        context = self.run_handler(ValueError("not in the database"))
+        self.assertEqual(context['message'], 'Task exception was never retrieved')
+
+    def test_loads_translator_in_executor(self):
+        exc_i18n.translator = None
+        context = self.run_handler(NameError("name 'a' is not defined"))
+        self.assertTrue(exc_i18n.translator is not None)
+        self.assertTrue(context['message'].startswith('Task exception was never retrieved\nNameError: '))
+
+    def test_translates_in_executor(self):
+        threads = []
+        class Client(object):
+            # like a TranslationClient, translate() blocks on a socket
+            def translate(self, exc_name, formatted_msg):
+                threads.append(threading.current_thread())
+                return 'traducido'
+        exc_i18n.translator = Client()
+        context = self.run_handler(NameError("name 'a' is not defined"))
+        self.assertEqual(context['message'], "Task exception was never retrieved\n"
+                                             "NameError: traducido")
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_cached_translation_on_loop(self):
+        translator = exc_i18n.ExceptionTranslator(exc_db, trans_db, cache_size=10)
+        translator.translate("NameError", "name 'a' is not defined")
+        exc_i18n.translator = translator
+        def record(loop, context):
+            self.contexts.append(context)
+            self.assertEqual(len(self.contexts), 1)
+        async def main():
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(record)
+            asyncio_hook.install()
+            loop.call_exception_handler({'message': 'Task exception was never retrieved',
+                                         'exception': NameError("name 'a' is not defined")})
+            # handled right away, without a trip through the executor
+            self.assertEqual(len(self.contexts), 1)
+        asyncio.run(main())
+        self.assertTrue(self.contexts[0]['message'].endswith("el nombre 'a' no ha sido definido"))
+
+    def test_closed_loop(self):
+        exc_i18n.translator = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+        failed = []
+        async def fail():
+            raise NameError("name 'a' is not defined")
+        async def main():
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(self.record)
+            asyncio_hook.install()
+            failed.append(loop.create_task(fail()))
+            await asyncio.sleep(0)
+        asyncio.run(main())
+        # the task is collected after the loop closed, its exception was
+        # never retrieved
+        failed.clear()
+        gc.collect()
+        self.assertEqual(len(self.contexts), 1)
+        self.assertEqual(self.contexts[0]['message'], 'Task exception was never retrieved')
+
+    @unittest.skipUnless(hasattr(asyncio.Task, 'get_context'),
+                         'Task.get_context() is new in Python 3.12')
+    def test_language_of_the_task(self):
+        fr_db = TranslationDatabase(set(trans_db.translations))
+        fr_db.add(TranslationObj(exc_name="NameError", exc_text="name %s is not defined", language_code="fr", translation="le nom %s n'est pas défini"))
+        exc_i18n.translator = exc_i18n.ExceptionTranslator(exc_db, fr_db)
+        async def fail():
+            exc_i18n.set_context_language('fr')
+            raise NameError("name 'a' is not defined")
+        async def main():
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(self.record)
+            asyncio_hook.install()
+            task = loop.create_task(fail())
+            await asyncio.sleep(0)
+            loop.call_exception_handler({'message': 'Task exception was never retrieved',
+                                         'exception': task.exception(), 'task': task})
+            while not self.contexts:
+                await asyncio.sleep(0.01)
+        asyncio.run(asyncio.wait_for(main(), 10))
+        self.assertTrue(self.contexts[0]['message'].endswith("le nom 'a' n'est pas défini"))
+
+
+if __name__ == "__main__":
+    unittest.main()
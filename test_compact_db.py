@@ -0,0 +1,80 @@
+import os
+import unittest
+
+from database import ExceptionObj, TranslationObj, ExceptionDatabase, \
+                      TranslationDatabase
+from compact_db import CompactExceptionDatabase, CompactTranslationDatabase, \
+                       convert, is_compact
+
+
+class CompactDatabaseTest(unittest.TestCase):
+    exc_filename = './test_data/tmp_exc_db.bin'
+    trans_filename = './test_data/tmp_trans.bin'
+
+    def setUp(self):
+        db = ExceptionDatabase()
+        db.add(ExceptionObj("ValueError", '%s too long'))
+        db.add(ExceptionObj("ValueError", '%s es muy largo'))
+        db.add(ExceptionObj("UnicodeDecodeError", "can't decode"))
+        db.add(ExceptionObj("UnicodeEncodeError", "can't encode ñ"))
+        with open(self.exc_filename, 'wb') as f:
+            CompactExceptionDatabase.dump(db, f)
+        self.exc_db = CompactExceptionDatabase.load(self.exc_filename)
+
+        db = TranslationDatabase()
+        db.add(TranslationObj("ValueError", '%s too long', 'es', '%s muy largo'))
+        db.add(TranslationObj("ValueError", '%s too long', 'pt', '%s muito longo'))
+        db.add(TranslationObj("NameError", '%s not exists', 'es', '%s no existe'))
+        with open(self.trans_filename, 'wb') as f:
+            CompactTranslationDatabase.dump(db, f)
+        self.trans_db = CompactTranslationDatabase.load(self.trans_filename)
+
+    def tearDown(self):
+        self.exc_db.close()
+        self.trans_db.close()
+        os.remove(self.exc_filename)
+        os.remove(self.trans_filename)
+
+    def test_filter(self):
+        self.assertEqual(len(self.exc_db.all()), 4)
+        self.assertEqual(len(self.exc_db.filter(name="ValueError")), 2)
+        self.assertEqual(len(self.exc_db.filter(name="NameError")), 0)
+        self.assertEqual(self.exc_db.filter(prefix="UnicodeE"),
+                         {ExceptionObj("UnicodeEncodeError", "can't encode ñ")})
+        self.assertEqual(self.exc_db.names(),
+                         {"ValueError", "UnicodeDecodeError", "UnicodeEncodeError"})
+
+    def test_get(self):
+        trans = self.trans_db.get("ValueError", '%s too long', 'pt')
+        self.assertEqual(trans, TranslationObj("ValueError", '%s too long', 'pt', '%s muito longo'))
+        self.assertEqual(self.trans_db.get("ValueError", '%s too long', 'fr'), None)
+        self.assertEqual(self.trans_db.get("ValueError", '%s too', 'es'), None)
+        self.assertEqual(self.trans_db.languages(), {'es', 'pt'})
+        self.assertEqual(len(self.trans_db.all()), 3)
+
+    def test_get_many(self):
+        keys = [("ValueError", '%s too long'), ("NameError", '%s not exists'),
+                ("ValueError", "ñ"), ("ValueError", '%s too long')]
+        for lang in ('es', 'pt', 'fr', 'a', 'z'):
+            self.assertEqual(self.trans_db.get_many(keys, lang),
+                             [self.trans_db.get(name, text, lang)
+                              for name, text in keys])
+        self.assertEqual(self.trans_db.get_many([], 'es'), [])
+
+    def test_wrong_type(self):
+        with open(self.exc_filename, 'rb') as f:
+            self.assertRaises(ValueError, CompactTranslationDatabase, f)
+
+    def test_convert_pickle(self):
+        convert('./exc_db.pickle', self.exc_filename)
+        self.assertTrue(is_compact(self.exc_filename))
+        with open('./exc_db.pickle', 'rb') as f:
+            db = ExceptionDatabase.load_from_pickle(f)
+        compact = CompactExceptionDatabase.load(self.exc_filename)
+        self.assertEqual(compact.all(), db.all())
+        self.assertEqual(compact.filter(name="TypeError"), db.filter(name="TypeError"))
+        compact.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
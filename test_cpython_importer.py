@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import shutil
+import tarfile
+import subprocess
+import tempfile
+import unittest
+
+from cpython_importer import CPythonExceptionImporter, ImportManifest, blob_hash
+from database import ExceptionObj
+
+abstract_c = '''
+    PyErr_SetString(PyExc_TypeError, "object of type has no len()");
+    PyErr_Format(PyExc_TypeError,
+                 "'%.200s' object is not subscriptable", Py_TYPE(o)->tp_name);
+'''
+
+errors_c = '''
+    PyErr_SetString(PyExc_SystemError, "this file is never imported");
+'''
+
+
+class SourceTreeTestCase(unittest.TestCase):
+    "builds a small CPython source tree in a temporary directory"
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        for directory in ('Python', 'Objects', 'Modules', 'Lib'):
+            os.mkdir(os.path.join(self.path, directory))
+        self.write('Objects/abstract.c', abstract_c)
+        self.write('Python/errors.c', errors_c)
+        self.write('Lib/not_imported.c', errors_c)
+        self.write('Modules/README', errors_c)
+        shutil.copy('./test_data/posixmodule.c',
+                    os.path.join(self.path, 'Modules', 'posixmodule.c'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, text):
+        with open(os.path.join(self.path, *name.split('/')), 'w') as f:
+            f.write(text)
+
+
+class DoImportTests(SourceTreeTestCase):
+
+    def test_source_files(self):
+        importer = CPythonExceptionImporter(self.path)
+        self.assertEqual(importer.source_files(),
+                         ['Modules/posixmodule.c', 'Objects/abstract.c'])
+
+    def test_do_import(self):
+        exceptions = CPythonExceptionImporter(self.path).do_import()
+        self.assertIn(ExceptionObj("TypeError", "object of type has no len()"),
+                      exceptions)
+        self.assertNotIn(ExceptionObj("SystemError", "this file is never imported"),
+                         exceptions)
+        self.assertTrue(len(exceptions) > 50)
+
+    def test_parallel_import(self):
+        importer = CPythonExceptionImporter(self.path)
+        self.assertEqual(importer.do_import(jobs=2), importer.do_import())
+
+
+class TarballTests(SourceTreeTestCase):
+
+    def make_tarball(self, mode, arcname='Python-3.3.2'):
+        fd, archive = tempfile.mkstemp(suffix='.tar')
+        os.close(fd)
+        self.addCleanup(os.remove, archive)
+        with tarfile.open(archive, mode) as tar:
+            tar.add(self.path, arcname=arcname)
+        return archive
+
+    def test_import_tarballs(self):
+        exceptions = CPythonExceptionImporter(self.path).do_import()
+        for mode in ('w', 'w:gz', 'w:bz2', 'w:xz'):
+            importer = CPythonExceptionImporter(self.make_tarball(mode))
+            self.assertEqual(importer.do_import(), exceptions)
+            self.assertEqual(importer.stats['parsed'], 2)
+
+    def test_tarball_without_top_directory(self):
+        importer = CPythonExceptionImporter(self.make_tarball('w:gz', '.'))
+        self.assertEqual(sorted(name for name, blob, data in importer.sources()),
+                         ['Modules/posixmodule.c', 'Objects/abstract.c'])
+
+    def test_tarball_with_manifest(self):
+        manifest = ImportManifest()
+        CPythonExceptionImporter(self.path).do_import(manifest=manifest)
+        importer = CPythonExceptionImporter(self.make_tarball('w:xz'))
+        importer.do_import(manifest=manifest)
+        self.assertEqual(importer.stats, {'parsed': 0, 'reused': 2, 'removed': 0})
+
+
+class GitTests(SourceTreeTestCase):
+
+    def git(self, *args):
+        subprocess.check_output(('git', '-C', self.path, '-c', 'user.name=test',
+                                 '-c', 'user.email=test@example.com') + args,
+                                stderr=subprocess.STDOUT)
+
+    def setUp(self):
+        super(GitTests, self).setUp()
+        self.git('init', '-q')
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', 'first')
+        self.git('tag', 'v1')
+        self.v1_exceptions = CPythonExceptionImporter(self.path).do_import()
+        self.write('Objects/abstract.c', abstract_c.replace('no len()', 'no size'))
+        self.git('commit', '-q', '-a', '-m', 'second')
+        self.git('tag', 'v2')
+        self.write('Objects/abstract.c', 'not committed')
+        self.bare = self.path + '.git'
+        subprocess.check_output(('git', 'clone', '-q', '--bare', self.path, self.bare),
+                                stderr=subprocess.STDOUT)
+        self.addCleanup(shutil.rmtree, self.bare)
+
+    def test_import_ref(self):
+        for repo in (self.bare, self.path):
+            importer = CPythonExceptionImporter(repo, ref='v1')
+            self.assertEqual(importer.do_import(), self.v1_exceptions)
+            self.assertEqual(sorted(name for name, blob, data in importer.sources()),
+                             ['Modules/posixmodule.c', 'Objects/abstract.c'])
+
+    def test_blob_hashes(self):
+        importer = CPythonExceptionImporter(self.bare, ref='v1')
+        for name, blob, data in importer.sources():
+            self.assertEqual(blob, blob_hash(data))
+
+    def test_reuses_known_blobs(self):
+        manifest = ImportManifest()
+        CPythonExceptionImporter(self.bare, ref='v1').do_import(manifest=manifest)
+        importer = CPythonExceptionImporter(self.bare, ref='v2')
+        known = manifest.by_blob()
+        self.assertEqual([(name, data is None) for name, blob, data
+                          in importer.sources(known)],
+                         [('Modules/posixmodule.c', True), ('Objects/abstract.c', False)])
+        exceptions = importer.do_import(manifest=manifest)
+        self.assertEqual(importer.stats, {'parsed': 1, 'reused': 1, 'removed': 0})
+        self.assertIn(ExceptionObj("TypeError", "object of type has no size"), exceptions)
+
+    def test_unknown_ref(self):
+        importer = CPythonExceptionImporter(self.bare, ref='v3')
+        self.assertRaises(ValueError, importer.do_import)
+
+
+class BlockFinderTests(unittest.TestCase):
+    find = staticmethod(CPythonExceptionImporter.c_block_finder)
+
+    def test_source_order_and_nesting(self):
+        code = '''
+            FORMAT_EXCEPTION(PyExc_ValueError, "%s too long", name);
+            PyErr_Format(PyExc_TypeError, "%.200s() takes (%d)", f(g(x)), n);
+            PyErr_SetString(PyExc_OSError, "a");
+        '''
+        self.assertEqual(self.find(code),
+                         ['FORMAT_EXCEPTION(PyExc_ValueError, "%s too long", name)',
+                          'PyErr_Format(PyExc_TypeError, "%.200s() takes (%d)", f(g(x)), n)',
+                          'PyErr_SetString(PyExc_OSError, "a")'])
+
+    def test_skips_comments_and_strings(self):
+        code = '''
+            /* PyErr_SetString(PyExc_OSError, "commented"); */
+            // PyErr_SetString(PyExc_OSError, "commented");
+            puts("PyErr_SetString(PyExc_OSError, \\"in a string\\");");
+            PyErr_SetString(PyExc_ValueError, /* ) */ "a ) \\" ;" ")");
+            MyPyErr_SetString(PyExc_OSError, "not the macro");
+        '''
+        self.assertEqual(self.find(code),
+                         ['PyErr_SetString(PyExc_ValueError, /* ) */ "a ) \\" ;" ")")'])
+
+    def test_requires_pyexc(self):
+        code = '''
+            PyErr_Format(state->error, "no exception type %d", n);
+            PyErr_SetString(PyExc_OSError, "second");
+        '''
+        blocks = self.find(code)
+        self.assertEqual(blocks, ['PyErr_SetString(PyExc_OSError, "second")'])
+        self.assertEqual(CPythonExceptionImporter.parse_c_code(blocks[0]),
+                         ExceptionObj("OSError", "second"))
+
+    def test_configurable_macros(self):
+        code = '''
+            PyErr_SetString(PyExc_OSError, "a");
+            RAISE(PyExc_ValueError, "b");
+        '''
+        self.assertEqual(self.find(code, ['RAISE']), ['RAISE(PyExc_ValueError, "b")'])
+
+    def test_unbalanced_call(self):
+        self.assertEqual(self.find('PyErr_SetString(PyExc_OSError, "a"'), [])
+
+
+class ManifestTests(SourceTreeTestCase):
+
+    def test_blob_hash(self):
+        # same as git hash-object
+        self.assertEqual(blob_hash(b'hello\n'),
+                         'ce013625030ba8dba906f756967f9e9ca394464a')
+
+    def test_incremental_import(self):
+        importer = CPythonExceptionImporter(self.path)
+        manifest = ImportManifest()
+        exceptions = importer.do_import(manifest=manifest)
+        self.assertEqual(importer.stats, {'parsed': 2, 'reused': 0, 'removed': 0})
+        self.assertEqual(sorted(manifest.files), ['Modules/posixmodule.c',
+                                                  'Objects/abstract.c'])
+
+        fobj = io.BytesIO()
+        manifest.dump(fobj)
+        fobj.seek(0)
+        manifest = ImportManifest.load_from_pickle(fobj)
+        self.assertEqual(importer.do_import(manifest=manifest), exceptions)
+        self.assertEqual(importer.stats, {'parsed': 0, 'reused': 2, 'removed': 0})
+
+        self.write('Objects/abstract.c', abstract_c.replace('no len()', 'no size'))
+        self.write('Python/ceval.c', 'PyErr_SetString(PyExc_NameError, "a new one");')
+        os.remove(os.path.join(self.path, 'Modules', 'posixmodule.c'))
+        exceptions = importer.do_import(manifest=manifest)
+        self.assertEqual(importer.stats, {'parsed': 2, 'reused': 0, 'removed': 1})
+        self.assertEqual(exceptions, CPythonExceptionImporter(self.path).do_import())
+        self.assertIn(ExceptionObj("NameError", "a new one"), exceptions)
+        self.assertNotIn(ExceptionObj("TypeError", "object of type has no len()"),
+                         exceptions)
+
+    def test_macros_change_parses_again(self):
+        manifest = ImportManifest()
+        CPythonExceptionImporter(self.path).do_import(manifest=manifest)
+        importer = CPythonExceptionImporter(self.path, ['PyErr_SetString'])
+        importer.do_import(manifest=manifest)
+        self.assertEqual(importer.stats, {'parsed': 2, 'reused': 0, 'removed': 0})
+        self.assertEqual(manifest.macros, ('PyErr_SetString',))
+
+    def test_renamed_file_is_reused(self):
+        importer = CPythonExceptionImporter(self.path)
+        manifest = ImportManifest()
+        importer.do_import(manifest=manifest)
+        os.rename(os.path.join(self.path, 'Objects', 'abstract.c'),
+                  os.path.join(self.path, 'Objects', 'object.c'))
+        importer.do_import(jobs=2, manifest=manifest)
+        self.assertEqual(importer.stats, {'parsed': 0, 'reused': 2, 'removed': 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
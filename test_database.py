@@ -127,12 +127,48 @@ class DatabaseTest(unittest.TestCase):
         self.assertEqual(len(db.filter(name="ValueError")), 2)
         self.assertEqual(len(db.filter(name="NameError")), 0)
 
+    def test_filter_by_names_and_prefix(self):
+        db = ExceptionDatabase()
+        db.add(ExceptionObj("ValueError", '%s too long'))
+        db.add(ExceptionObj("UnicodeDecodeError", "can't decode"))
+        db.add(ExceptionObj("UnicodeEncodeError", "can't encode"))
+        db.add(ExceptionObj("NameError", '%s not exists'))
+        self.assertEqual(len(db.filter(names=["ValueError", "NameError"])), 2)
+        self.assertEqual(len(db.filter(prefix="Unicode")), 2)
+        self.assertEqual(len(db.filter(names=["ValueError", "UnicodeDecodeError"], prefix="Unicode")), 1)
+        self.assertEqual(len(db.filter(name="ValueError", names=["NameError"])), 0)
+        self.assertEqual(len(db.filter()), 4)
+
+    def test_filter_index_after_load_from_pickle(self):
+        with open('./exc_db.pickle', 'rb') as f:
+            db = ExceptionDatabase.load_from_pickle(f)
+        type_errors = {exc for exc in db.all() if exc.name == "TypeError"}
+        self.assertEqual(db.filter(name="TypeError"), type_errors)
+
     def test_get(self):
         db = TranslationDatabase()
         db.add(TranslationObj("ValueError", '%s too long', 'en', ''))
         db.add(TranslationObj("ValueError", '%s es muy largo', 'es', ''))
         self.assertTrue(db.get("ValueError", '%s es muy largo', 'es'))
 
+    def test_get_is_per_language(self):
+        db = TranslationDatabase()
+        db.add(TranslationObj("ValueError", '%s too long', 'es', '%s muy largo'))
+        db.add(TranslationObj("ValueError", '%s too long', 'pt', '%s muito longo'))
+        self.assertEqual(db.get("ValueError", '%s too long', 'pt').translation, '%s muito longo')
+        self.assertEqual(db.get("ValueError", '%s too long', 'fr'), None)
+        self.assertEqual(db.languages(), {'es', 'pt'})
+
+    def test_get_many(self):
+        db = TranslationDatabase()
+        db.add(TranslationObj("ValueError", '%s too long', 'es', '%s muy largo'))
+        db.add(TranslationObj("NameError", '%s not exists', 'es', '%s no existe'))
+        result = db.get_many([("NameError", '%s not exists'),
+                              ("NameError", 'missing'),
+                              ("ValueError", '%s too long')], 'es')
+        self.assertEqual([t and t.translation for t in result],
+                         ['%s no existe', None, '%s muy largo'])
+
     def test_load_from_pickle(self):
         with open('./exc_db.pickle', 'rb') as f:
             db = ExceptionDatabase.load_from_pickle(f)
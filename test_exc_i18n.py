@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import gc
+import os
+import json
+import sys
+import asyncio
+import tempfile
+import threading
 import unittest
+import compact_db
 import exc_i18n
 from database import ExceptionDatabase, ExceptionObj, TranslationDatabase, TranslationObj
 
@@ -46,6 +54,48 @@ class ExceptionTranslatorSearchTests(unittest.TestCase):
                                               "argument should be 748.ble, not bla132.41jvv vnslvn")
         self.assertEqual(exc.text, "argument should be %s, not %.200s")
 
+    def test_exact_match_counters(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+        t.search_exception("SyntaxError", "EOL while scanning string literal")
+        t.search_exception("NameError", "name 'a' is not defined")
+        t.search_exception("Whatever", "this exception is not translated")
+        self.assertEqual((t.exact_hits, t.exact_misses), (2, 1))
+
+    def test_typed_patterns(self):
+        def values(text, msg):
+            exc = ExceptionObj(name="TypeError", text=text)
+            res = translator._build_deformating_regex(exc).match(msg)
+            return res and res.groups()
+        self.assertEqual(values("%s takes %zd arguments", "f takes 2 arguments"), ('f', '2'))
+        self.assertEqual(values("%s takes %zd arguments", "f takes two arguments"), None)
+        self.assertEqual(values("got %ld, %i and %u", "got -1, 2 and 3"), ('-1', '2', '3'))
+        self.assertEqual(values("bad char %c in %.5s", "bad char x in hello"), ('x', 'hello'))
+        self.assertEqual(values("bad char %c in %.5s", "bad char xy in hello"), None)
+        self.assertEqual(values("bad char %c in %.5s", "bad char x in hello!"), None)
+        self.assertEqual(values("%d%% done", "50% done"), ('50',))
+        self.assertEqual(values("%s%s takes no arguments", "f() takes no arguments"), ('', 'f()'))
+        self.assertEqual(values("%R\n%R", "'a'\n'b'"), ("'a'", "'b'"))
+
+    def test_parse_template(self):
+        literals, specs = exc_i18n.parse_template("%.200s: 100%% of %zd items%U")
+        self.assertEqual(literals, ['', ': 100% of ', ' items', ''])
+        self.assertEqual([spec.group() for spec in specs], ['%.200s', '%zd', '%U'])
+
+    def test_specific_template_wins(self):
+        templates = [ExceptionObj("TypeError", "%s"),
+                     ExceptionObj("TypeError", "%s: %s"),
+                     ExceptionObj("TypeError", "%s() takes no arguments"),
+                     ExceptionObj("TypeError", "%s() takes %s")]
+        for ordering in (templates, templates[::-1]):
+            db = ExceptionDatabase()
+            for exc in ordering:
+                db.add(exc)
+            t = exc_i18n.ExceptionTranslator(db, trans_db)
+            self.assertEqual(t.search_exception("TypeError", "f() takes no arguments"), templates[2])
+            self.assertEqual(t.search_exception("TypeError", "f() takes 1"), templates[3])
+            self.assertEqual(t.search_exception("TypeError", "a: b"), templates[1])
+            self.assertEqual(t.search_exception("TypeError", "whatever"), templates[0])
+
     def test_extract_values_from_error(self):
         exc_name = "TypeError"
         formatted_msg = "argument should be 748.ble, not bla132.41jvv vnslvn"
@@ -53,6 +103,60 @@ class ExceptionTranslatorSearchTests(unittest.TestCase):
         values = translator.extract_values(exc, formatted_msg)
         self.assertEqual(values, ('748.ble', 'bla132.41jvv vnslvn'))
 
+    def test_matchers_are_precompiled(self):
+        exc = ExceptionObj(name="NameError", text="name %s is not defined")
+        matcher = translator.get_matcher(exc)
+        translator.search_exception("NameError", "name 'a' is not defined")
+        self.assertIs(translator.get_matcher(exc), matcher)
+
+    def test_match_template_with_regex_chars(self):
+        db = ExceptionDatabase()
+        db.add(ExceptionObj(name="TypeError", text="sum() can't sum strings [use ''.join(seq) instead]"))
+        db.add(ExceptionObj(name="TypeError", text="%s() takes no arguments (%d given)"))
+        t = exc_i18n.ExceptionTranslator(db, TranslationDatabase())
+        exc = t.search_exception("TypeError", "sum() can't sum strings [use ''.join(seq) instead]")
+        self.assertEqual(exc.text, "sum() can't sum strings [use ''.join(seq) instead]")
+        exc = ExceptionObj(name="TypeError", text="%s() takes no arguments (%d given)")
+        self.assertEqual(t.extract_values(exc, "f() takes no arguments (1 given)"), ('f', '1'))
+
+class TemplateMatcherTests(unittest.TestCase):
+
+    templates = [ExceptionObj("TypeError", "argument should be %s, not %.200s"),
+                 ExceptionObj("TypeError", "%s() takes no arguments"),
+                 ExceptionObj("TypeError", "%s: %s"),
+                 ExceptionObj("TypeError", "unhashable type")]
+
+    def setUp(self):
+        regexes = [translator._build_deformating_regex(exc) for exc in self.templates]
+        self.matcher = exc_i18n.TemplateMatcher(self.templates, regexes)
+
+    def test_candidates_by_prefix(self):
+        self.assertEqual(self.matcher.candidates("argument should be a, not b"), [0, 2])
+
+    def test_candidates_by_suffix(self):
+        self.assertEqual(self.matcher.candidates("f() takes no arguments"), [1, 2])
+
+    def test_match_in_template_order(self):
+        exc, values = self.matcher.match("f() takes no arguments")
+        self.assertEqual(exc, self.templates[1])
+        self.assertEqual(values, ('f',))
+
+    def test_no_match(self):
+        self.assertEqual(self.matcher.match("unhashable types"), (None, None))
+
+    def test_trailing_newline(self):
+        # a newline after the last literal text doesn't match, whether the
+        # template is indexed by prefix, by suffix or by its whole text
+        self.assertEqual(self.matcher.match("f() takes no arguments\n"), (None, None))
+        self.assertEqual(self.matcher.match("unhashable type\n"), (None, None))
+        self.assertEqual(translator.search_exception("NameError", "name 'a' is not defined\n"),
+                         None)
+        # a trailing value takes it, like any other character
+        exc, values = self.matcher.match("argument should be a, not b\n")
+        self.assertEqual(values, ('a', 'b\n'))
+        exc, values = self.matcher.match("f\n() takes no arguments")
+        self.assertEqual(values, ('f\n',))
+
 class ExceptionTranslatorTranslationTests(unittest.TestCase):
 
     def test_search_translation(self):
@@ -79,6 +183,306 @@ class ExceptionTranslatorTranslationTests(unittest.TestCase):
         translated_msg = translator.translate(exc_name, formatted_msg)
         self.assertEqual(translated_msg, "argumento debe ser 748.ble, no bla132.41jvv vnslvn")
 
+    def test_translation_plans(self):
+        db = ExceptionDatabase()
+        db.add(ExceptionObj("TypeError", "%.200s() takes %zd arguments (%zd given)"))
+        db.add(ExceptionObj("TypeError", "can't convert %R to %U"))
+        db.add(ExceptionObj("TypeError", "%s is not %s"))
+        db.add(ExceptionObj("TypeError", "not translated yet"))
+        tdb = TranslationDatabase()
+        tdb.add(TranslationObj("TypeError", "%.200s() takes %zd arguments (%zd given)", "es",
+                               "se pasaron %3$zd argumentos a %1$.200s(), toma %2$zd"))
+        tdb.add(TranslationObj("TypeError", "can't convert %R to %U", "es",
+                               "no se puede convertir a %2$U (100%%)"))
+        tdb.add(TranslationObj("TypeError", "%s is not %s", "es", "%s no es %s ni %s"))
+        tdb.add(TranslationObj("TypeError", "not translated yet", "es", ""))
+        t = exc_i18n.ExceptionTranslator(db, tdb)
+        t.set_language_code('es')
+        self.assertEqual(t.translate("TypeError", "f() takes 1 arguments (2 given)"),
+                         "se pasaron 2 argumentos a f(), toma 1")
+        self.assertEqual(t.translate("TypeError", "can't convert 'a' to int"),
+                         "no se puede convertir a int (100%)")
+        # formats more values than the template has
+        self.assertRaises(exc_i18n.TranslationMissing, t.translate, "TypeError", "a is not b")
+        self.assertRaises(exc_i18n.TranslationMissing, t.translate, "TypeError", "not translated yet")
+
+    def test_switch_languages(self):
+        tdb = TranslationDatabase()
+        tdb.add(TranslationObj("NameError", "name %s is not defined", "es", "el nombre %s no ha sido definido"))
+        tdb.add(TranslationObj("NameError", "name %s is not defined", "pt", "o nome %s não foi definido"))
+        t = exc_i18n.ExceptionTranslator(exc_db, tdb)
+        for language_code, translation in [('pt', "o nome 'a' não foi definido"),
+                                           ('es', "el nombre 'a' no ha sido definido"),
+                                           ('pt', "o nome 'a' não foi definido")]:
+            t.set_language_code(language_code)
+            self.assertEqual(t.translate("NameError", "name 'a' is not defined"), translation)
+        self.assertEqual(set(t._plans), {'es', 'pt'})
+
+    def test_translate_many(self):
+        translator.set_language_code('es')
+        items = [("NameError", "name 'a' is not defined"),
+                 ("Whatever", "this exception is not translated"),
+                 ("SyntaxError", "EOL while scanning string literal"),
+                 ("Whatever", "this exception is not in the database"),
+                 ("NameError", "name 'a' is not defined")]
+        results = list(translator.translate_many(items))
+        self.assertEqual([(r.exc_name, r.formatted_msg) for r in results], items)
+        self.assertEqual([r.translation for r in results],
+                         ["el nombre 'a' no ha sido definido", None,
+                          "te olvidaste una comilla pelandrún", None,
+                          "el nombre 'a' no ha sido definido"])
+        self.assertEqual([r.error for r in results],
+                         [None, exc_i18n.TranslationMissing, None,
+                          exc_i18n.TranslationNotSupported, None])
+
+
+class ActivateTests(unittest.TestCase):
+
+    def tearDown(self):
+        sys.excepthook = sys.__excepthook__
+
+    def test_lazy_activate(self):
+        exc_i18n.activate(lazy=True)
+        self.assertIs(sys.excepthook, exc_i18n.i18n_hook)
+        self.assertEqual(exc_i18n.translator, None)
+        t = exc_i18n.get_translator()
+        self.assertTrue(t.exc_db.all())
+        self.assertIs(exc_i18n.get_translator(), t)
+
+    def test_set_language_code_keeps_translator(self):
+        exc_i18n.activate()
+        t = exc_i18n.translator
+        exc_i18n.set_language_code('en')
+        exc_i18n.set_language_code('es')
+        self.assertIs(exc_i18n.translator, t)
+        self.assertEqual(t.language_code, 'es')
+
+    def test_set_language_code_before_lazy_load(self):
+        exc_i18n.activate(lazy=True)
+        exc_i18n.set_language_code('en')
+        self.assertEqual(exc_i18n.get_translator().language_code, 'en')
+        exc_i18n.set_language_code('es')
+
+    def test_background_activate(self):
+        exc_i18n.activate(background=True)
+        self.assertTrue(exc_i18n.get_translator().exc_db.all())
+
+    def test_preload_and_fork(self):
+        tmpdir = tempfile.mkdtemp()
+        exc_db_path = os.path.join(tmpdir, 'exc_db.bin')
+        trans_db_path = os.path.join(tmpdir, 'trans.bin')
+        compact_db.convert(exc_i18n.EXC_DB_PATH, exc_db_path)
+        compact_db.convert(exc_i18n.TRANS_DB_PATH, trans_db_path)
+        try:
+            t = exc_i18n.preload(['en'], exc_db_path, trans_db_path)
+            self.assertIs(sys.excepthook, exc_i18n.i18n_hook)
+            self.assertIs(exc_i18n.get_translator(), t)
+            self.assertIsInstance(t.exc_db, compact_db.CompactExceptionDatabase)
+            self.assertEqual(set(t._plans), {'en', 'es'})
+            self.assertEqual(gc.get_freeze_count(), 0)
+            translation = t.translate('NameError', "name 'a' is not defined")
+            pid = os.fork()
+            if pid == 0:
+                ok = exc_i18n.get_translator().translate(
+                    'NameError', "name 'a' is not defined") == translation
+                os._exit(0 if ok else 1)
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        finally:
+            exc_i18n.translator = None
+            os.remove(exc_db_path)
+            os.remove(trans_db_path)
+            os.rmdir(tmpdir)
+
+    def test_preload_freeze(self):
+        try:
+            t = exc_i18n.preload(freeze=True)
+            self.assertTrue(gc.get_freeze_count())
+            self.assertTrue(t.translate('NameError', "name 'a' is not defined"))
+        finally:
+            gc.unfreeze()
+            exc_i18n.translator = None
+
+
+class ContextLanguageTests(unittest.TestCase):
+
+    translations = {'es': "el nombre %s no ha sido definido",
+                    'pt': "o nome %s não foi definido",
+                    'it': "il nome %s non è definito"}
+
+    def setUp(self):
+        tdb = TranslationDatabase()
+        for language_code, translation in self.translations.items():
+            tdb.add(TranslationObj("NameError", "name %s is not defined",
+                                   language_code, translation))
+        self.translator = exc_i18n.ExceptionTranslator(exc_db, tdb, cache_size=16)
+
+    def test_use_language(self):
+        t = self.translator
+        with exc_i18n.use_language('pt'):
+            self.assertEqual(t.language_code, 'pt')
+            self.assertEqual(t.translate("NameError", "name 'a' is not defined"),
+                             "o nome 'a' não foi definido")
+        self.assertEqual(t.language_code, 'es')
+
+    def test_threads_stress(self):
+        t = self.translator
+        languages = sorted(self.translations)
+        errors = []
+        start = threading.Barrier(32)
+
+        def worker(n):
+            language_code = languages[n % len(languages)]
+            exc_i18n.set_context_language(language_code)
+            start.wait()
+            for i in range(300):
+                # more distinct messages than cache entries, to race evictions
+                name = "'v%d'" % (i % 40)
+                result = t.translate("NameError", "name %s is not defined" % name)
+                if result != self.translations[language_code] % name:
+                    errors.append((language_code, result))
+                if i == 150 and n == 0:
+                    # the default language changing must not affect anyone
+                    t.set_language_code('it')
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(t.cache.evictions > 0)
+
+    def test_asyncio_tasks(self):
+        t = self.translator
+
+        async def handle(language_code):
+            exc_i18n.set_context_language(language_code)
+            await asyncio.sleep(0)
+            return t.translate("NameError", "name 'a' is not defined")
+
+        async def main():
+            return await asyncio.gather(*[handle(language_code)
+                                          for language_code in ('pt', 'it', 'es')])
+
+        self.assertEqual(asyncio.run(main()),
+                         ["o nome 'a' não foi definido", "il nome 'a' non è definito",
+                          "el nombre 'a' no ha sido definido"])
+        self.assertEqual(t.language_code, 'es')
+
+
+class TranslationCacheTests(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = exc_i18n.TranslationCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'evictions': 1,
+                                         'size': 2, 'maxsize': 2})
+
+    def test_translate_uses_cache(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db, cache_size=10)
+        t.set_language_code('es')
+        for i in range(3):
+            t.translate("NameError", "name 'a' is not defined")
+        self.assertEqual((t.cache.hits, t.cache.misses), (2, 1))
+
+    def test_translate_many_uses_cache(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db, cache_size=10)
+        t.set_language_code('es')
+        batch = [("NameError", "name 'a' is not defined"),
+                 ("NameError", "name 'b' is not defined"),
+                 ("NameError", "name 'a' is not defined")]
+        for i in range(3):
+            results = list(t.translate_many(batch))
+        self.assertEqual((t.cache.hits, t.cache.misses), (4, 2))
+        self.assertEqual(results[1].translation, "el nombre 'b' no ha sido definido")
+        self.assertEqual(t.translate("NameError", "name 'b' is not defined"),
+                         "el nombre 'b' no ha sido definido")
+        self.assertEqual(t.cache.hits, 5)
+
+    def test_translate_caches_errors(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db, cache_size=10)
+        for i in range(2):
+            self.assertRaises(exc_i18n.TranslationMissing, t.translate,
+                              "Whatever", "this exception is not translated")
+        self.assertEqual(t.cache.hits, 1)
+
+    def test_cache_invalidation(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db, cache_size=10)
+        t.translate("NameError", "name 'a' is not defined")
+        t.set_language_code('en')
+        self.assertRaises(exc_i18n.TranslationMissing, t.translate,
+                          "NameError", "name 'a' is not defined")
+        # entries are keyed by language, switching back reuses them
+        t.set_language_code('es')
+        t.translate("NameError", "name 'a' is not defined")
+        self.assertEqual((len(t.cache), t.cache.hits), (2, 1))
+        t.reload()
+        self.assertEqual(len(t.cache), 0)
+
+    def test_load_language_drops_its_entries(self):
+        db = TranslationDatabase(set(trans_db.translations))
+        t = exc_i18n.ExceptionTranslator(exc_db, db, cache_size=10)
+        t.translate("NameError", "name 'a' is not defined")
+        with exc_i18n.use_language('en'):
+            self.assertRaises(exc_i18n.TranslationMissing, t.translate,
+                              "NameError", "name 'a' is not defined")
+        db.add(TranslationObj(exc_name="NameError", exc_text="name %s is not defined",
+                              language_code="es", translation="%s no está definido"))
+        t.load_language('es')
+        self.assertEqual(len(t.cache), 1)
+        self.assertEqual(t.translate("NameError", "name 'a' is not defined"),
+                         "'a' no está definido")
+
+
+class TranslationStatsTests(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+        t.translate("NameError", "name 'a' is not defined")
+        self.assertEqual(t.stats, None)
+
+    def test_stages(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db, stats=True)
+        t.set_language_code('es')
+        self.assertEqual(t.translate("NameError", "name 'a' is not defined"),
+                         "el nombre 'a' no ha sido definido")
+        t.translate("SyntaxError", "EOL while scanning string literal")
+        self.assertRaises(exc_i18n.TranslationMissing, t.translate,
+                          "Whatever", "this exception is not translated")
+        self.assertRaises(exc_i18n.TranslationNotSupported, t.translate,
+                          "NameError", "not a NameError message")
+        stats = t.stats.as_dict()
+        self.assertEqual(stats['lookups'], 4)
+        self.assertEqual({stage: s['count'] for stage, s in stats['stages'].items()},
+                         {'literal': 4, 'match': 2, 'plan': 3, 'render': 2})
+        self.assertEqual(stats['candidates'], {'0': 3, '2': 1})
+        self.assertTrue(all(s['total_s'] >= 0 for s in stats['stages'].values()))
+
+    def test_translate_many_and_dump(self):
+        t = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+        stats = t.enable_stats()
+        results = list(t.translate_many([("NameError", "name 'a' is not defined"),
+                                         ("NameError", "name 'a' is not defined"),
+                                         ("NameError", "name 'b' is not defined")]))
+        self.assertEqual(results[2].translation, "el nombre 'b' no ha sido definido")
+        self.assertEqual(stats.lookups, 2)
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            stats.dump(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)['stages']['render']['count'], 2)
+        finally:
+            os.remove(path)
+        t.disable_stats()
+        t.translate("NameError", "name 'a' is not defined")
+        self.assertEqual(stats.lookups, 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+import exc_i18n
+import translate_log
+from database import ExceptionDatabase, ExceptionObj, TranslationDatabase, TranslationObj
+
+exc_db = ExceptionDatabase()
+exc_db.add(ExceptionObj(name="NameError", text="name %s is not defined"))
+exc_db.add(ExceptionObj(name="JSONDecodeError", text="Expecting value"))
+
+trans_db = TranslationDatabase()
+trans_db.add(TranslationObj(exc_name="NameError", exc_text="name %s is not defined", language_code="es", translation="el nombre %s no ha sido definido"))
+trans_db.add(TranslationObj(exc_name="JSONDecodeError", exc_text="Expecting value", language_code="es", translation="Se esperaba un valor"))
+
+translator = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+
+log = '''2013-06-23 10:00:01 INFO starting
+2013-06-23 10:00:02 ERROR request failed
+Traceback (most recent call last):
+  File "app.py", line 3, in <module>
+    foo
+NameError: name 'foo' is not defined
+NameError: name 'bar' is not defined
+Traceback (most recent call last):
+  File "app.py", line 5, in <module>
+    json.loads('')
+json.decoder.JSONDecodeError: Expecting value
+Traceback (most recent call last):
+  File "app.py", line 7, in <module>
+    1/0
+ZeroDivisionError: division by zero
+'''
+
+translated_log = '''2013-06-23 10:00:01 INFO starting
+2013-06-23 10:00:02 ERROR request failed
+Traceback (most recent call last):
+  File "app.py", line 3, in <module>
+    foo
+NameError: el nombre 'foo' no ha sido definido
+NameError: name 'bar' is not defined
+Traceback (most recent call last):
+  File "app.py", line 5, in <module>
+    json.loads('')
+json.decoder.JSONDecodeError: Se esperaba un valor
+Traceback (most recent call last):
+  File "app.py", line 7, in <module>
+    1/0
+ZeroDivisionError: division by zero
+'''
+
+class TranslateLogTests(unittest.TestCase):
+
+    def test_translate_lines(self):
+        lines = translate_log.translate_lines(log.splitlines(True), translator)
+        self.assertEqual(''.join(lines), translated_log)
+
+    def test_keeps_line_endings(self):
+        lines = ['Traceback (most recent call last):\r\n',
+                 '  File "app.py", line 3, in <module>\r\n',
+                 "NameError: name 'foo' is not defined\r\n"]
+        result = list(translate_log.translate_lines(lines, translator))
+        self.assertEqual(result[-1], "NameError: el nombre 'foo' no ha sido definido\r\n")
+
+    def test_chunks_dont_split_tracebacks(self):
+        chunks = list(translate_log.traceback_chunks(log.splitlines(True), 1))
+        self.assertEqual(''.join(sum(chunks, [])), log)
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1, 4, 1, 4, 4])
+
+    def test_translate_lines_parallel(self):
+        exc_db_path = './test_data/tmp_exc_db.pickle'
+        trans_db_path = './test_data/tmp_trans.pickle'
+        with open(exc_db_path, 'wb') as f:
+            exc_db.dump(f)
+        with open(trans_db_path, 'wb') as f:
+            trans_db.dump(f)
+        try:
+            lines = translate_log.translate_lines_parallel(
+                log.splitlines(True) * 20, 2, exc_db_path, trans_db_path, 'es',
+                chunk_size=7)
+            self.assertEqual(''.join(lines), translated_log * 20)
+        finally:
+            os.remove(exc_db_path)
+            os.remove(trans_db_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
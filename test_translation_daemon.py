@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+import exc_i18n
+import translation_daemon
+from database import ExceptionDatabase, ExceptionObj, TranslationDatabase, TranslationObj
+from exc_i18n import TranslationMissing, TranslationNotSupported
+
+exc_db = ExceptionDatabase()
+exc_db.add(ExceptionObj(name="NameError", text="name %s is not defined"))
+exc_db.add(ExceptionObj(name="ValueError", text="math domain error"))
+
+trans_db = TranslationDatabase()
+trans_db.add(TranslationObj(exc_name="NameError", exc_text="name %s is not defined", language_code="es", translation="el nombre %s no ha sido definido"))
+trans_db.add(TranslationObj(exc_name="NameError", exc_text="name %s is not defined", language_code="fr", translation="le nom %s n'est pas défini"))
+
+
+class WireFormatTests(unittest.TestCase):
+
+    def test_request_round_trip(self):
+        items = [("NameError", "name 'ñ' is not defined"), ("ValueError", "")]
+        frame = translation_daemon.encode_request(items, 'es')
+        body = frame[translation_daemon.FRAME.size:]
+        self.assertEqual(translation_daemon.decode_request(body), ('es', items))
+        frame = translation_daemon.encode_request(items)
+        body = frame[translation_daemon.FRAME.size:]
+        self.assertEqual(translation_daemon.decode_request(body), (None, items))
+
+    def test_response_round_trip(self):
+        results = [exc_i18n.TranslationResult("NameError", "x", "ñ", None),
+                   exc_i18n.TranslationResult("ValueError", "x", None, TranslationMissing)]
+        frame = translation_daemon.encode_response(results)
+        body = frame[translation_daemon.FRAME.size:]
+        self.assertEqual(translation_daemon.decode_response(body),
+                         [("ñ", None), (None, TranslationMissing)])
+
+    def test_truncated_request(self):
+        frame = translation_daemon.encode_request([("NameError", "name 'a' is not defined")])
+        body = frame[translation_daemon.FRAME.size:-3]
+        self.assertRaises(translation_daemon.ProtocolError,
+                          translation_daemon.decode_request, body)
+
+
+class DaemonTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'exc_i18n.sock')
+        translator = exc_i18n.ExceptionTranslator(exc_db, trans_db)
+        translator.set_language_code('es')
+        self.server = translation_daemon.TranslationServer(self.path, translator)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = translation_daemon.TranslationClient(self.path)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        os.rmdir(self.tmpdir)
+
+    def test_translate(self):
+        self.assertEqual(self.client.translate("NameError", "name 'a' is not defined"),
+                         "el nombre 'a' no ha sido definido")
+        self.assertRaises(TranslationMissing, self.client.translate,
+                          "ValueError", "math domain error")
+        self.assertRaises(TranslationNotSupported, self.client.translate,
+                          "ValueError", "not in the database")
+
+    def test_language(self):
+        self.client.set_language_code('fr')
+        self.assertEqual(self.client.translate("NameError", "name 'a' is not defined"),
+                         "le nom 'a' n'est pas défini")
+        with exc_i18n.use_language('es'):
+            self.assertEqual(self.client.translate("NameError", "name 'a' is not defined"),
+                             "el nombre 'a' no ha sido definido")
+
+    def test_pipelined_batches(self):
+        batches = [[("NameError", "name '%d' is not defined" % (i * 10 + j))
+                    for j in range(10)] for i in range(20)]
+        for batch in batches:
+            self.client.send_batch(batch)
+        for i, batch in enumerate(batches):
+            results = self.client.recv_batch()
+            self.assertEqual([r.translation for r in results],
+                             ["el nombre '%d' no ha sido definido" % (i * 10 + j)
+                              for j in range(10)])
+            self.assertEqual([(r.exc_name, r.formatted_msg) for r in results], batch)
+
+    def test_pipelined_large_batches(self):
+        # more than the socket buffers hold, both ways
+        batches = [[("NameError", "name '%d' is not defined" % (i * 500 + j))
+                    for j in range(500)] for i in range(100)]
+        for batch in batches:
+            self.client.send_batch(batch)
+        for i, batch in enumerate(batches):
+            results = self.client.recv_batch()
+            self.assertEqual([(r.exc_name, r.formatted_msg) for r in results], batch)
+            self.assertEqual(results[-1].translation,
+                             "el nombre '%d' no ha sido definido" % (i * 500 + 499))
+
+    def test_concurrent_clients(self):
+        errors = []
+        def work(n):
+            try:
+                client = translation_daemon.TranslationClient(self.path)
+                for i in range(50):
+                    msg = "name '%d-%d' is not defined" % (n, i)
+                    if client.translate("NameError", msg) != \
+                      "el nombre '%d-%d' no ha sido definido" % (n, i):
+                        errors.append(msg)
+                client.close()
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_existing_path(self):
+        translator = self.server.translator
+        # a daemon listening on it
+        self.assertRaises(OSError, translation_daemon.TranslationServer,
+                          self.path, translator)
+        # a socket nothing listens on is replaced
+        stale = os.path.join(self.tmpdir, 'stale.sock')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        translation_daemon.TranslationServer(stale, translator).server_close()
+        self.assertFalse(os.path.exists(stale))
+        # anything else is left alone
+        with open(stale, 'w') as f:
+            f.write('data')
+        self.assertRaises(FileExistsError, translation_daemon.TranslationServer,
+                          stale, translator)
+        with open(stale) as f:
+            self.assertEqual(f.read(), 'data')
+        os.remove(stale)
+
+    def test_activate(self):
+        translator, excepthook = exc_i18n.translator, sys.excepthook
+        try:
+            translation_daemon.activate(self.path)
+            self.assertIs(sys.excepthook, exc_i18n.i18n_hook)
+            self.assertEqual(exc_i18n.get_translator().translate("NameError", "name 'a' is not defined"),
+                             "el nombre 'a' no ha sido definido")
+            exc_i18n.translator.close()
+        finally:
+            exc_i18n.translator, sys.excepthook = translator, excepthook
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import io
+import re
+import sys
+from collections import deque
+from multiprocessing import Pool
+
+from exc_i18n import ExceptionTranslator, TranslationMissing, \
+                     TranslationNotSupported, load_databases, \
+                     EXC_DB_PATH, TRANS_DB_PATH, DEFAULT_CACHE_SIZE
+
+description = 'Translates the exceptions of the tracebacks found in a log'
+
+TRACEBACK_HEADER = 'Traceback (most recent call last):'
+# the last line of a traceback, eg: "json.decoder.JSONDecodeError: Expecting value"
+EXCEPTION_LINE = re.compile(r'^([A-Za-z_][\w.]*): (.*)$')
+
+
+def translate_exception_line(line, translator):
+    """Returns the "ExcName: message" line with the message translated, or
+    the line unchanged if it can't be translated.
+    """
+    body = line.rstrip('\r\n')
+    ending = line[len(body):]
+    match = EXCEPTION_LINE.match(body)
+    if not match:
+        return line
+    exc_name, formatted_msg = match.groups()
+    try:
+        translation = translator.translate(exc_name.rpartition('.')[2],
+                                           formatted_msg)
+    except (TranslationMissing, TranslationNotSupported):
+        return line
+    return '%s: %s%s' % (exc_name, translation, ending)
+
+
+def translate_lines(lines, translator):
+    """Yields the lines with the exception line of every traceback
+    translated. The exception line is the first one after the traceback
+    header that is not indented.
+    """
+    in_traceback = False
+    for line in lines:
+        if in_traceback and not line[:1].isspace():
+            in_traceback = False
+            line = translate_exception_line(line, translator)
+        elif line.rstrip('\r\n').endswith(TRACEBACK_HEADER):
+            in_traceback = True
+        yield line
+
+
+def traceback_chunks(lines, size):
+    """Groups the lines in lists of about size lines, never splitting a
+    traceback between two lists.
+    """
+    chunk = []
+    in_traceback = False
+    for line in lines:
+        chunk.append(line)
+        if in_traceback and not line[:1].isspace():
+            in_traceback = False
+        elif line.rstrip('\r\n').endswith(TRACEBACK_HEADER):
+            in_traceback = True
+        if len(chunk) >= size and not in_traceback:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_translator(exc_db_path, trans_db_path, language_code=None):
+    exc_db, trans_db = load_databases(exc_db_path, trans_db_path)
+    translator = ExceptionTranslator(exc_db, trans_db,
+                                     cache_size=DEFAULT_CACHE_SIZE)
+    if language_code:
+        translator.set_language_code(language_code)
+    return translator
+
+_worker_translator = None
+
+def _init_worker(exc_db_path, trans_db_path, language_code):
+    global _worker_translator
+    _worker_translator = load_translator(exc_db_path, trans_db_path,
+                                         language_code)
+
+def _translate_chunk(chunk):
+    return list(translate_lines(chunk, _worker_translator))
+
+
+def translate_lines_parallel(lines, jobs, exc_db_path=EXC_DB_PATH,
+                             trans_db_path=TRANS_DB_PATH, language_code=None,
+                             chunk_size=1000):
+    """Like translate_lines but spreads chunks of lines across jobs worker
+    processes. At most 2 * jobs chunks are in flight, so memory stays
+    bounded however long the input is.
+    """
+    initargs = (exc_db_path, trans_db_path, language_code)
+    with Pool(jobs, initializer=_init_worker, initargs=initargs) as pool:
+        pending = deque()
+        for chunk in traceback_chunks(lines, chunk_size):
+            pending.append(pool.apply_async(_translate_chunk, (chunk,)))
+            if len(pending) >= 2 * jobs:
+                for line in pending.popleft().get():
+                    yield line
+        while pending:
+            for line in pending.popleft().get():
+                yield line
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("infile", nargs='?', default='-',
+                        help='log file to translate, - for stdin (default)')
+    parser.add_argument("-o", "--output", default='-',
+                        help='output file, - for stdout (default)')
+    parser.add_argument("-l", "--language",
+                        help='the language code. Eg: es')
+    parser.add_argument("--exc-db", default=EXC_DB_PATH,
+                        help='path to the exceptions db filename')
+    parser.add_argument("--trans-db", default=TRANS_DB_PATH,
+                        help='path to the translations db filename')
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help='lines sent to a worker process at a time')
+    args = parser.parse_args()
+
+    # keep the line endings and any undecodable byte of the log untouched
+    text_args = dict(encoding='utf-8', errors='surrogateescape', newline='')
+    if args.infile == '-':
+        infile = io.TextIOWrapper(sys.stdin.buffer, **text_args)
+    else:
+        infile = open(args.infile, **text_args)
+    if args.output == '-':
+        outfile = io.TextIOWrapper(sys.stdout.buffer, **text_args)
+    else:
+        outfile = open(args.output, 'w', **text_args)
+
+    with infile, outfile:
+        if args.jobs > 1:
+            lines = translate_lines_parallel(infile, args.jobs, args.exc_db,
+                                             args.trans_db, args.language,
+                                             args.chunk_size)
+        else:
+            translator = load_translator(args.exc_db, args.trans_db,
+                                         args.language)
+            lines = translate_lines(infile, translator)
+        outfile.writelines(lines)
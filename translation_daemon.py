@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""Translation daemon: loads the databases once and answers the
+translation requests of many processes over a Unix domain socket.
+
+Every request and response is a frame: a 4 bytes big endian length and a
+body. A request body is the language code (empty for the daemon default)
+and a batch of (exc_name, formatted_msg) pairs::
+
+    H len, language | I count | count * (H len, exc_name | I len, formatted_msg)
+
+A response body has one (status, text) item per pair, in order::
+
+    I count | count * (B status | I len, text)
+
+Requests can be pipelined: a client may send several frames before reading
+the responses, which come back in the same order. The daemon writes every
+response before it reads the next request, so a pipelining client must
+keep reading while it sends, or both ends block on full socket buffers.
+"""
+
+import os
+import errno
+import select
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+
+import exc_i18n
+from exc_i18n import ExceptionTranslator, TranslationMissing, \
+                     TranslationNotSupported, TranslationResult, \
+                     load_databases, use_language, \
+                     EXC_DB_PATH, TRANS_DB_PATH, DEFAULT_CACHE_SIZE
+
+description = 'Serves exception translations over a Unix domain socket'
+
+SOCKET_PATH = '/tmp/exc_i18n.sock'
+
+# bytes read from the socket at once by the client
+RECV_SIZE = 65536
+
+FRAME = struct.Struct('!I')
+SHORT = struct.Struct('!H')
+LONG = struct.Struct('!I')
+STATUS = struct.Struct('!B')
+
+# status of a translation on the wire
+STATUS_CODES = {None: 0, TranslationMissing: 1, TranslationNotSupported: 2}
+STATUS_ERRORS = {code: error for error, code in STATUS_CODES.items()}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _pack_str(parts, fmt, text):
+    data = text.encode('utf-8')
+    parts.append(fmt.pack(len(data)))
+    parts.append(data)
+
+def _unpack_str(body, offset, fmt):
+    (length,) = fmt.unpack_from(body, offset)
+    offset += fmt.size
+    end = offset + length
+    if end > len(body):
+        raise ProtocolError('truncated frame')
+    return body[offset:end].decode('utf-8'), end
+
+
+def encode_request(items, language_code=None):
+    parts = []
+    _pack_str(parts, SHORT, language_code or '')
+    parts.append(LONG.pack(len(items)))
+    for exc_name, formatted_msg in items:
+        _pack_str(parts, SHORT, exc_name)
+        _pack_str(parts, LONG, formatted_msg)
+    body = b''.join(parts)
+    return FRAME.pack(len(body)) + body
+
+def decode_request(body):
+    "returns (language_code or None, [(exc_name, formatted_msg), ...])"
+    language_code, offset = _unpack_str(body, 0, SHORT)
+    (count,) = LONG.unpack_from(body, offset)
+    offset += LONG.size
+    items = []
+    for i in range(count):
+        exc_name, offset = _unpack_str(body, offset, SHORT)
+        formatted_msg, offset = _unpack_str(body, offset, LONG)
+        items.append((exc_name, formatted_msg))
+    return language_code or None, items
+
+def encode_response(results):
+    parts = [LONG.pack(len(results))]
+    for result in results:
+        parts.append(STATUS.pack(STATUS_CODES[result.error]))
+        _pack_str(parts, LONG, result.translation or '')
+    body = b''.join(parts)
+    return FRAME.pack(len(body)) + body
+
+def decode_response(body):
+    "returns [(translation or None, error class or None), ...]"
+    (count,) = LONG.unpack_from(body, 0)
+    offset = LONG.size
+    results = []
+    for i in range(count):
+        (status,) = STATUS.unpack_from(body, offset)
+        translation, offset = _unpack_str(body, offset + STATUS.size, LONG)
+        error = STATUS_ERRORS[status]
+        results.append((None if error else translation, error))
+    return results
+
+def read_frame(rfile):
+    "returns the body of the next frame, or None at the end of the stream"
+    header = rfile.read(FRAME.size)
+    if not header:
+        return None
+    if len(header) < FRAME.size:
+        raise ProtocolError('truncated frame')
+    (length,) = FRAME.unpack(header)
+    body = rfile.read(length)
+    if len(body) < length:
+        raise ProtocolError('truncated frame')
+    return body
+
+
+class TranslationRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        translator = self.server.translator
+        while True:
+            try:
+                body = read_frame(self.rfile)
+                if body is None:
+                    return
+                language_code, items = decode_request(body)
+            except (ProtocolError, struct.error, UnicodeDecodeError) as e:
+                sys.stderr.write("Warning: closing connection: %s\n" % e)
+                return
+            if language_code:
+                with use_language(language_code):
+                    results = list(translator.translate_many(items))
+            else:
+                results = list(translator.translate_many(items))
+            self.wfile.write(encode_response(results))
+
+
+class TranslationServer(socketserver.ThreadingUnixStreamServer):
+    """Serves the translations of translator, a thread per connection.
+
+    A socket left at path by a daemon that is gone is replaced. Raises
+    OSError if another daemon listens on it or path is not a socket.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, translator):
+        self.remove_stale_socket(path)
+        self.translator = translator
+        socketserver.ThreadingUnixStreamServer.__init__(
+            self, path, TranslationRequestHandler)
+
+    @staticmethod
+    def remove_stale_socket(path):
+        "removes the socket at path if nothing accepts connections on it"
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError(errno.EEXIST, 'not a socket, not replacing it',
+                                  path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)
+            return
+        finally:
+            sock.close()
+        raise OSError(errno.EADDRINUSE, 'a daemon is already listening', path)
+
+    def server_close(self):
+        socketserver.ThreadingUnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class TranslationClient(object):
+    """Client of a translation daemon with the translate() API of
+    ExceptionTranslator, so i18n_hook can use it as exc_i18n.translator.
+
+    send_batch() and recv_batch() can be used directly to pipeline
+    requests; translate() and translate_many() send one request and wait
+    for its response, and are safe to use from several threads.
+
+    There is no limit to the requests in flight: the socket is non-blocking
+    and, whenever the daemon can't take more of a request, send_batch()
+    reads the responses already written, so the daemon never blocks on
+    them. They are kept in memory until recv_batch() returns them.
+    """
+
+    def __init__(self, path=SOCKET_PATH, language_code=None):
+        self.path = path
+        self.language_code = language_code
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._sock.setblocking(False)
+        # received bytes of the responses not returned yet
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        # items of the requests sent whose response was not read yet
+        self._pending = []
+
+    def set_language_code(self, language_code):
+        self.language_code = language_code
+
+    def send_batch(self, items, language_code=None):
+        items = list(items)
+        language_code = language_code or exc_i18n._context_language.get() \
+                        or self.language_code
+        self._send(encode_request(items, language_code))
+        self._pending.append(items)
+
+    def _send(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[self._sock.send(view):]
+            except BlockingIOError:
+                readable, writable, _ = select.select([self._sock],
+                                                      [self._sock], [])
+                if readable:
+                    self._recv()
+
+    def _recv(self):
+        "reads the bytes available into the buffer, waiting for some"
+        while True:
+            try:
+                data = self._sock.recv(RECV_SIZE)
+                break
+            except BlockingIOError:
+                select.select([self._sock], [], [])
+        if not data:
+            raise ProtocolError('connection closed by the daemon')
+        self._buffer += data
+
+    def _read_frame(self):
+        "returns the body of the next frame of the buffer, receiving it"
+        while True:
+            if len(self._buffer) >= FRAME.size:
+                (length,) = FRAME.unpack_from(self._buffer)
+                end = FRAME.size + length
+                if len(self._buffer) >= end:
+                    body = bytes(self._buffer[FRAME.size:end])
+                    del self._buffer[:end]
+                    return body
+            self._recv()
+
+    def recv_batch(self):
+        "returns the TranslationResults of the oldest request sent"
+        body = self._read_frame()
+        items = self._pending.pop(0)
+        return [TranslationResult(exc_name, formatted_msg, translation, error)
+                for (exc_name, formatted_msg), (translation, error)
+                in zip(items, decode_response(body))]
+
+    def translate_many(self, items, language_code=None):
+        with self._lock:
+            self.send_batch(items, language_code)
+            return self.recv_batch()
+
+    def translate(self, exc_name, formatted_msg):
+        result = self.translate_many([(exc_name, formatted_msg)])[0]
+        if result.error:
+            raise(result.error(result.error.message))
+        return result.translation
+
+    def close(self):
+        self._sock.close()
+
+
+def activate(path=SOCKET_PATH):
+    """installs exc_i18n.i18n_hook using the daemon listening on path
+    instead of an in-process translator"""
+    exc_i18n.translator = TranslationClient(path)
+    sys.excepthook = exc_i18n.i18n_hook
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-s", "--socket", default=SOCKET_PATH,
+                        help='path of the Unix domain socket')
+    parser.add_argument("-l", "--language",
+                        help='default language code. Eg: es')
+    parser.add_argument("--exc-db", default=EXC_DB_PATH,
+                        help='path to the exceptions db filename')
+    parser.add_argument("--trans-db", default=TRANS_DB_PATH,
+                        help='path to the translations db filename')
+    args = parser.parse_args()
+
+    exc_db, trans_db = load_databases(args.exc_db, args.trans_db)
+    translator = ExceptionTranslator(exc_db, trans_db,
+                                     cache_size=DEFAULT_CACHE_SIZE)
+    if args.language:
+        translator.set_language_code(args.language)
+
+    try:
+        server = TranslationServer(args.socket, translator)
+    except OSError as e:
+        parser.error(str(e))
+    print('Serving translations on %s' % args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()